@@ -0,0 +1,35 @@
+"""
+Test script to check that the calamine and openpyxl engines read the ENTERED ON sheet
+with the same rows, dtypes and values
+"""
+import os
+import sys
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entered_on_converter import CALAMINE_AVAILABLE, restore_integer_columns
+
+SAMPLE_WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "23-08-2025 Entered On.xlsm")
+
+def test_engines_match_dtypes():
+    """calamine (after restore_integer_columns) and openpyxl give the same frame on the sample workbook"""
+    if not CALAMINE_AVAILABLE:
+        print("python-calamine not installed, skipping")
+        return
+
+    openpyxl_df = pd.read_excel(SAMPLE_WORKBOOK, sheet_name='ENTERED ON', engine='openpyxl')
+    calamine_df = restore_integer_columns(
+        pd.read_excel(SAMPLE_WORKBOOK, sheet_name='ENTERED ON', engine='calamine')
+    )
+
+    assert len(calamine_df) == len(openpyxl_df), f"calamine {len(calamine_df)} rows vs openpyxl {len(openpyxl_df)}"
+    for col in ['NIGHTS', 'PERSONS', 'TDF', 'Booking Lead Time ']:
+        assert calamine_df[col].dtype == openpyxl_df[col].dtype, (
+            f"{col}: calamine {calamine_df[col].dtype} vs openpyxl {openpyxl_df[col].dtype}"
+        )
+    pd.testing.assert_frame_equal(calamine_df, openpyxl_df)
+    print("✅ calamine and openpyxl frames match")
+
+if __name__ == "__main__":
+    test_engines_match_dtypes()
@@ -26,6 +26,11 @@ class AuditDatabase:
         """Context manager for database connections"""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row  # Enable column access by name
+        # WAL (set in init_database) makes NORMAL sync safe; keep temp data and a 64MB page cache in memory
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA busy_timeout=5000")
         try:
             yield conn
             conn.commit()
@@ -79,12 +84,23 @@ class AuditDatabase:
                 logger.info("Adding 'insert_user' column to reservations_audit table")
                 conn.execute("ALTER TABLE reservations_audit ADD COLUMN insert_user TEXT DEFAULT 'MANUAL_ENTRY'")
             
+            # Tag cached email extractions with the extraction version that produced them
+            cursor.execute("PRAGMA table_info(email_cache)")
+            columns = [col[1] for col in cursor.fetchall()]
+            
+            if columns and 'extraction_version' not in columns:
+                logger.info("Adding 'extraction_version' column to email_cache table")
+                conn.execute("ALTER TABLE email_cache ADD COLUMN extraction_version TEXT")
+            
         except Exception as e:
             logger.warning(f"Schema migration failed: {e}")
     
     def init_database(self):
         """Initialize database with all required tables"""
         with self.get_connection() as conn:
+            # Write-ahead logging persists in the database file, so it only needs setting once
+            conn.execute("PRAGMA journal_mode=WAL")
+            
             # Run schema migrations first
             self._migrate_schema(conn)
             # Create audit_log table (run tracking)
@@ -218,6 +234,17 @@ class AuditDatabase:
                 )
             """)
             
+            # Create email_cache table (extraction results keyed by Outlook EntryID)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS email_cache (
+                    entry_id TEXT PRIMARY KEY,
+                    received_time TEXT,
+                    extracted_json TEXT,  -- JSON storage for extracted_data and attachments
+                    cached_timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+                    extraction_version TEXT  -- results from another version are re-extracted
+                )
+            """)
+            
             # Create indices for better query performance
             conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_run_id ON reservations_raw(run_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_guest ON reservations_raw(full_name)")
@@ -225,6 +252,9 @@ class AuditDatabase:
             conn.execute("CREATE INDEX IF NOT EXISTS idx_email_guest ON reservations_email(guest_name)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_run_id ON reservations_audit(run_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_status ON reservations_audit(audit_status)")
+            # (run_timestamp, run_id) so the runs list can seek on its keyset cursor
+            conn.execute("DROP INDEX IF EXISTS idx_log_timestamp")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_log_timestamp_run ON audit_log(run_timestamp, run_id)")
             
         logger.info(f"Database initialized at {self.db_path}")
     
@@ -336,51 +366,51 @@ class AuditDatabase:
     def save_email_extraction(self, email_results: List[Dict], run_id: str) -> int:
         """Save email extraction results"""
         try:
-            with self.get_connection() as conn:
-                count = 0
+            # Build every row before opening the write transaction
+            records = []
+            for result in email_results:
+                guest_name = result['reservation_data'].get('FULL_NAME', '')
                 
-                for result in email_results:
-                    guest_name = result['reservation_data'].get('FULL_NAME', '')
+                for email in result.get('matching_emails', []):
+                    extracted_data = email.get('extracted_data', {})
                     
-                    for email in result.get('matching_emails', []):
-                        extracted_data = email.get('extracted_data', {})
-                        
-                        record = {
-                            'run_id': run_id,
-                            'guest_name': guest_name,
-                            'email_subject': email.get('subject', ''),
-                            'email_sender': email.get('sender', ''),
-                            'email_received_time': str(email.get('received_time', '')),
-                            'folder_name': email.get('folder', ''),
-                            'mail_first_name': extracted_data.get('FIRST_NAME', ''),
-                            'mail_arrival': extracted_data.get('ARRIVAL', ''),
-                            'mail_departure': extracted_data.get('DEPARTURE', ''),
-                            'mail_nights': extracted_data.get('NIGHTS', 0) if extracted_data.get('NIGHTS') != 'N/A' else 0,
-                            'mail_persons': extracted_data.get('PERSONS', 0) if extracted_data.get('PERSONS') != 'N/A' else 0,
-                            'mail_room': extracted_data.get('ROOM', ''),
-                            'mail_rate_code': extracted_data.get('RATE_CODE', ''),
-                            'mail_c_t_s': extracted_data.get('C_T_S', ''),
-                            'mail_c_t_s_name': extracted_data.get('C_T_S_NAME', ''),
-                            'insert_user': extracted_data.get('INSERT_USER', 'MANUAL_ENTRY'),
-                            'mail_net': self._parse_float(extracted_data.get('NET', 0)),
-                            'mail_net_total': self._parse_float(extracted_data.get('NET_TOTAL', 0)),
-                            'mail_total': self._parse_float(extracted_data.get('TOTAL', 0)),
-                            'mail_tdf': self._parse_float(extracted_data.get('TDF', 0)),
-                            'mail_adr': self._parse_float(extracted_data.get('ADR', 0)),
-                            'mail_amount': self._parse_float(extracted_data.get('AMOUNT', 0)),
-                            'pdf_attachment_count': len([att for att in email.get('attachments', []) if att.get('filename', '').lower().endswith('.pdf')]),
-                            'raw_email_data': json.dumps(self._serialize_email_data(email))
-                        }
-                        
-                        placeholders = ', '.join(['?' for _ in record.keys()])
-                        columns = ', '.join(record.keys())
-                        
-                        conn.execute(f"""
-                            INSERT INTO reservations_email ({columns})
-                            VALUES ({placeholders})
-                        """, list(record.values()))
-                        
-                        count += 1
+                    record = {
+                        'run_id': run_id,
+                        'guest_name': guest_name,
+                        'email_subject': email.get('subject', ''),
+                        'email_sender': email.get('sender', ''),
+                        'email_received_time': str(email.get('received_time', '')),
+                        'folder_name': email.get('folder', ''),
+                        'mail_first_name': extracted_data.get('FIRST_NAME', ''),
+                        'mail_arrival': extracted_data.get('ARRIVAL', ''),
+                        'mail_departure': extracted_data.get('DEPARTURE', ''),
+                        'mail_nights': extracted_data.get('NIGHTS', 0) if extracted_data.get('NIGHTS') != 'N/A' else 0,
+                        'mail_persons': extracted_data.get('PERSONS', 0) if extracted_data.get('PERSONS') != 'N/A' else 0,
+                        'mail_room': extracted_data.get('ROOM', ''),
+                        'mail_rate_code': extracted_data.get('RATE_CODE', ''),
+                        'mail_c_t_s': extracted_data.get('C_T_S', ''),
+                        'mail_c_t_s_name': extracted_data.get('C_T_S_NAME', ''),
+                        'insert_user': extracted_data.get('INSERT_USER', 'MANUAL_ENTRY'),
+                        'mail_net': self._parse_float(extracted_data.get('NET', 0)),
+                        'mail_net_total': self._parse_float(extracted_data.get('NET_TOTAL', 0)),
+                        'mail_total': self._parse_float(extracted_data.get('TOTAL', 0)),
+                        'mail_tdf': self._parse_float(extracted_data.get('TDF', 0)),
+                        'mail_adr': self._parse_float(extracted_data.get('ADR', 0)),
+                        'mail_amount': self._parse_float(extracted_data.get('AMOUNT', 0)),
+                        'pdf_attachment_count': len([att for att in email.get('attachments', []) if att.get('filename', '').lower().endswith('.pdf')]),
+                        'raw_email_data': json.dumps(self._serialize_email_data(email))
+                    }
+                    records.append(record)
+            
+            count = len(records)
+            if records:
+                columns = ', '.join(records[0].keys())
+                placeholders = ', '.join(['?' for _ in records[0]])
+                with self.get_connection() as conn:
+                    conn.executemany(f"""
+                        INSERT INTO reservations_email ({columns})
+                        VALUES ({placeholders})
+                    """, [list(record.values()) for record in records])
                 
             self.update_run_stats(run_id, {
                 'emails_found_count': count,
@@ -393,78 +423,76 @@ class AuditDatabase:
             self.log_error(run_id, str(e), "save_email_extraction")
             raise
     
-    def save_audit_results(self, audit_df: pd.DataFrame, run_id: str) -> int:
-        """Save final audit results"""
+    def save_audit_results(self, audit_df: pd.DataFrame, run_id: str, chunksize: int = 10_000) -> int:
+        """Save final audit results, inserting chunksize rows per executemany in one transaction"""
         try:
-            with self.get_connection() as conn:
-                records = []
+            # Track pass/fail counts (rows without an audit_status count as failed)
+            if 'audit_status' in audit_df.columns:
+                pass_count = int((audit_df['audit_status'] == 'PASS').sum())
+            else:
                 pass_count = 0
-                fail_count = 0
-                
-                for _, row in audit_df.iterrows():
-                    # Track pass/fail counts
-                    if row.get('audit_status') == 'PASS':
-                        pass_count += 1
-                    else:
-                        fail_count += 1
-                    
-                    record = {
-                        'run_id': run_id,
-                        # Original data
-                        'full_name': row.get('FULL_NAME', ''),
-                        'first_name': row.get('FIRST_NAME', ''),
-                        'arrival': row.get('ARRIVAL', ''),
-                        'departure': row.get('DEPARTURE', ''),
-                        'nights': row.get('NIGHTS', 0),
-                        'persons': row.get('PERSONS', 0),
-                        'room': row.get('ROOM', ''),
-                        'rate_code': row.get('RATE_CODE', ''),
-                        'c_t_s_name': row.get('C_T_S_NAME', ''),
-                        'net': row.get('NET', 0.0),
-                        'net_total': row.get('NET_TOTAL', 0.0),
-                        'amount': row.get('AMOUNT', 0.0),
-                        'adr': row.get('ADR', 0.0),
-                        'season': row.get('SEASON', ''),
-                        'long_booking_flag': row.get('LONG_BOOKING_FLAG', 0),
-                        'company_clean': row.get('COMPANY_CLEAN', ''),
-                        # Mail data
-                        'mail_first_name': row.get('Mail_FIRST_NAME', ''),
-                        'mail_arrival': row.get('Mail_ARRIVAL', ''),
-                        'mail_departure': row.get('Mail_DEPARTURE', ''),
-                        'mail_nights': row.get('Mail_NIGHTS', 0),
-                        'mail_persons': row.get('Mail_PERSONS', 0),
-                        'mail_room': row.get('Mail_ROOM', ''),
-                        'mail_rate_code': row.get('Mail_RATE_CODE', ''),
-                        'mail_c_t_s': row.get('Mail_C_T_S', ''),
-                        'mail_c_t_s_name': row.get('Mail_C_T_S_NAME', ''),
-                        'insert_user': row.get('Mail_INSERT_USER', 'MANUAL_ENTRY'),
-                        'mail_net': row.get('Mail_NET', 0.0),
-                        'mail_net_total': row.get('Mail_NET_TOTAL', 0.0),
-                        'mail_total': row.get('Mail_TOTAL', 0.0),
-                        'mail_tdf': row.get('Mail_TDF', 0.0),
-                        'mail_adr': row.get('Mail_ADR', 0.0),
-                        'mail_amount': row.get('Mail_AMOUNT', 0.0),
-                        # Audit results
-                        'audit_status': row.get('audit_status', 'PENDING'),
-                        'audit_issues': row.get('audit_issues', ''),
-                        'fields_matching': row.get('fields_matching', 0),
-                        'total_email_fields': row.get('total_email_fields', 0),
-                        'match_percentage': row.get('match_percentage', 0.0),
-                        'email_vs_data_status': row.get('email_vs_data_status', 'N/A'),
-                        'raw_audit_data': json.dumps(self._serialize_pandas_row(row))
-                    }
-                    records.append(record)
-                
-                # Insert records
-                for record in records:
-                    placeholders = ', '.join(['?' for _ in record.keys()])
-                    columns = ', '.join(record.keys())
-                    
-                    conn.execute(f"""
-                        INSERT INTO reservations_audit ({columns})
-                        VALUES ({placeholders})
-                    """, list(record.values()))
-                
+            fail_count = len(audit_df) - pass_count
+            
+            # Build every row before opening the write transaction
+            records = []
+            for row in audit_df.to_dict('records'):
+                record = {
+                    'run_id': run_id,
+                    # Original data
+                    'full_name': row.get('FULL_NAME', ''),
+                    'first_name': row.get('FIRST_NAME', ''),
+                    'arrival': row.get('ARRIVAL', ''),
+                    'departure': row.get('DEPARTURE', ''),
+                    'nights': row.get('NIGHTS', 0),
+                    'persons': row.get('PERSONS', 0),
+                    'room': row.get('ROOM', ''),
+                    'rate_code': row.get('RATE_CODE', ''),
+                    'c_t_s_name': row.get('C_T_S_NAME', ''),
+                    'net': row.get('NET', 0.0),
+                    'net_total': row.get('NET_TOTAL', 0.0),
+                    'amount': row.get('AMOUNT', 0.0),
+                    'adr': row.get('ADR', 0.0),
+                    'season': row.get('SEASON', ''),
+                    'long_booking_flag': row.get('LONG_BOOKING_FLAG', 0),
+                    'company_clean': row.get('COMPANY_CLEAN', ''),
+                    # Mail data
+                    'mail_first_name': row.get('Mail_FIRST_NAME', ''),
+                    'mail_arrival': row.get('Mail_ARRIVAL', ''),
+                    'mail_departure': row.get('Mail_DEPARTURE', ''),
+                    'mail_nights': row.get('Mail_NIGHTS', 0),
+                    'mail_persons': row.get('Mail_PERSONS', 0),
+                    'mail_room': row.get('Mail_ROOM', ''),
+                    'mail_rate_code': row.get('Mail_RATE_CODE', ''),
+                    'mail_c_t_s': row.get('Mail_C_T_S', ''),
+                    'mail_c_t_s_name': row.get('Mail_C_T_S_NAME', ''),
+                    'insert_user': row.get('Mail_INSERT_USER', 'MANUAL_ENTRY'),
+                    'mail_net': row.get('Mail_NET', 0.0),
+                    'mail_net_total': row.get('Mail_NET_TOTAL', 0.0),
+                    'mail_total': row.get('Mail_TOTAL', 0.0),
+                    'mail_tdf': row.get('Mail_TDF', 0.0),
+                    'mail_adr': row.get('Mail_ADR', 0.0),
+                    'mail_amount': row.get('Mail_AMOUNT', 0.0),
+                    # Audit results
+                    'audit_status': row.get('audit_status', 'PENDING'),
+                    'audit_issues': row.get('audit_issues', ''),
+                    'fields_matching': row.get('fields_matching', 0),
+                    'total_email_fields': row.get('total_email_fields', 0),
+                    'match_percentage': row.get('match_percentage', 0.0),
+                    'email_vs_data_status': row.get('email_vs_data_status', 'N/A'),
+                    'raw_audit_data': json.dumps(self._serialize_pandas_row(row))
+                }
+                records.append(record)
+            
+            if records:
+                columns = ', '.join(records[0].keys())
+                placeholders = ', '.join(['?' for _ in records[0]])
+                with self.get_connection() as conn:
+                    for start in range(0, len(records), chunksize):
+                        conn.executemany(f"""
+                            INSERT INTO reservations_audit ({columns})
+                            VALUES ({placeholders})
+                        """, [list(record.values()) for record in records[start:start + chunksize]])
+            
             # Update run statistics
             self.update_run_stats(run_id, {
                 'audit_pass_count': pass_count,
@@ -495,9 +523,9 @@ class AuditDatabase:
             return 0.0
     
     def _serialize_pandas_row(self, row) -> dict:
-        """Helper to serialize pandas row to JSON-compatible dict, handling Timestamps"""
+        """Helper to serialize a pandas row (Series or record dict) to a JSON-compatible dict, handling Timestamps"""
         result = {}
-        for key, value in row.to_dict().items():
+        for key, value in (row if isinstance(row, dict) else row.to_dict()).items():
             if pd.isna(value):
                 result[key] = None
             elif hasattr(value, 'isoformat'):  # datetime/Timestamp objects
@@ -524,18 +552,63 @@ class AuditDatabase:
                 result[key] = value
         return result
     
+    def load_email_cache(self, extraction_version: str, days: int) -> Dict[str, Tuple[str, str]]:
+        """Cached extraction results written by extraction_version in the last days (+1 of slack),
+        as {entry_id: (received_time, extracted_json)}. An email is cached no earlier than it is
+        received, so this covers every email inside a days-long search window in one query."""
+        with self.get_connection() as conn:
+            rows = conn.execute("""
+                SELECT entry_id, received_time, extracted_json FROM email_cache
+                WHERE extraction_version = ? AND cached_timestamp >= datetime('now', ?)
+            """, (extraction_version, f"-{days + 1} days")).fetchall()
+            return {row['entry_id']: (row['received_time'], row['extracted_json']) for row in rows}
+    
+    def put_cached_emails(self, records: List[Tuple[str, str, Dict]], extraction_version: str):
+        """Cache extraction results for Outlook emails, given as (entry_id, received_time, data)"""
+        with self.get_connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO email_cache (entry_id, received_time, extracted_json, extraction_version)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (entry_id, received_time, json.dumps(data, default=str), extraction_version)
+                for entry_id, received_time, data in records
+            ])
+    
+    def get_runs_version(self) -> Tuple[int, Optional[str]]:
+        """Cheap token (run count, latest run timestamp) that changes whenever a run is added or removed"""
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT COUNT(*), MAX(run_timestamp) FROM audit_log").fetchone()
+            return row[0], row[1]
+    
     def get_recent_runs(self, limit: int = 10) -> pd.DataFrame:
-        """Get recent audit runs"""
+        """Get recent audit runs, newest first, with run_timestamp formatted as YYYY-MM-DD HH:MM:SS"""
+        return self.get_runs_page(limit=limit)
+    
+    def get_runs_page(self, before: Optional[Tuple[str, str]] = None, limit: int = 50) -> pd.DataFrame:
+        """Get one page of audit runs older than the (run_timestamp, run_id) cursor before
+        (newest page if None), newest first.
+        
+        Keyset paging on the (run_timestamp, run_id) index, so later pages seek straight to the
+        cursor and cost the same as the first; run_id breaks timestamp ties so none are skipped.
+        cursor_timestamp and run_id of the last row are the before cursor for the next page.
+        """
+        where = "WHERE (audit_log.run_timestamp, audit_log.run_id) < (?, ?)" if before else ""
+        params = (*before, limit) if before else (limit,)
         with self.get_connection() as conn:
-            query = """
-                SELECT run_id, run_timestamp, excel_file_processed,
+            query = f"""
+                SELECT run_id, strftime('%Y-%m-%d %H:%M:%S', run_timestamp) AS run_timestamp, excel_file_processed,
                        reservations_loaded_count, emails_found_count, pdf_extractions_count,
-                       audit_pass_count, audit_fail_count, status, execution_time_seconds
+                       audit_pass_count, audit_fail_count, status, execution_time_seconds,
+                       CASE WHEN audit_pass_count + audit_fail_count > 0
+                            THEN 100.0 * audit_pass_count / (audit_pass_count + audit_fail_count)
+                       END AS success_rate,
+                       audit_log.run_timestamp AS cursor_timestamp
                 FROM audit_log 
-                ORDER BY run_timestamp DESC 
+                {where}
+                ORDER BY audit_log.run_timestamp DESC, audit_log.run_id DESC 
                 LIMIT ?
             """
-            return pd.read_sql_query(query, conn, params=(limit,))
+            return pd.read_sql_query(query, conn, params=params)
     
     def get_run_errors(self, run_id: str) -> List[Dict]:
         """Get errors for a specific run"""
@@ -615,13 +688,16 @@ class AuditDatabase:
                     'total_audits': audit_count
                 }
     
-    def export_data(self, table: str, run_id: str = None, filters: Dict = None) -> pd.DataFrame:
-        """Export data from any table with optional filtering"""
+    def export_data(self, table: str, run_id: str = None, filters: Dict = None,
+                    columns: List[str] = None) -> pd.DataFrame:
+        """Export data from any table with optional filtering; columns limits the selected columns"""
         if table not in ['reservations_raw', 'reservations_email', 'reservations_audit', 'audit_log']:
             raise ValueError(f"Invalid table name: {table}")
+        if columns and not all(column.isidentifier() for column in columns):
+            raise ValueError(f"Invalid column names: {columns}")
         
         with self.get_connection() as conn:
-            query = f"SELECT * FROM {table}"
+            query = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
             params = []
             conditions = []
             
@@ -634,6 +710,15 @@ class AuditDatabase:
             
             return pd.read_sql_query(query, conn, params=params)
     
+    def export_run_tables(self, run_id: str) -> Dict[str, pd.DataFrame]:
+        """Export the raw, email and audit rows of one run over a single connection"""
+        tables = {'raw': 'reservations_raw', 'email': 'reservations_email', 'audit': 'reservations_audit'}
+        with self.get_connection() as conn:
+            return {
+                key: pd.read_sql_query(f"SELECT * FROM {table} WHERE run_id = ?", conn, params=[run_id])
+                for key, table in tables.items()
+            }
+    
     def cleanup_old_runs(self, days_to_keep: int = 30):
         """Clean up old runs (optional maintenance function)"""
         cutoff_date = datetime.now() - pd.Timedelta(days=days_to_keep)
@@ -654,6 +739,13 @@ class AuditDatabase:
                     conn.execute(f"DELETE FROM {table} WHERE run_id IN ({placeholders})", old_run_ids)
                 
                 logger.info(f"Cleaned up {len(old_run_ids)} old runs")
-                return len(old_run_ids)
             
-            return 0
\ No newline at end of file
+            # Cached email extractions age out on the same schedule (cached_timestamp is UTC)
+            pruned = conn.execute(
+                "DELETE FROM email_cache WHERE cached_timestamp < datetime('now', ?)",
+                (f"-{days_to_keep} days",)
+            ).rowcount
+            if pruned:
+                logger.info(f"Pruned {pruned} cached email extractions")
+            
+            return len(old_runs)
\ No newline at end of file
@@ -17,10 +17,45 @@ import os
 import logging
 from database_operations import AuditDatabase
 
+# Rust-based Excel reader (pandas engine='calamine'), much faster than openpyxl on large sheets
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def read_entered_on_sheet(file_path):
+    """Read the ENTERED ON sheet from a path or binary file-like, using calamine when installed and openpyxl otherwise"""
+    if CALAMINE_AVAILABLE:
+        try:
+            return restore_integer_columns(pd.read_excel(file_path, sheet_name='ENTERED ON', engine='calamine'))
+        except ValueError as e:
+            # Older pandas without the calamine engine
+            logger.warning(f"Calamine read failed, falling back to openpyxl: {e}")
+            if hasattr(file_path, 'seek'):
+                file_path.seek(0)
+    return pd.read_excel(file_path, sheet_name='ENTERED ON', engine='openpyxl')
+
+def restore_integer_columns(df):
+    """
+    Make a calamine read match openpyxl's. Calamine keeps the blank rows at the end of the
+    sheet's used range and returns every numeric cell as float, so NIGHTS, PERSONS, TDF and
+    Booking Lead Time come back as float64 where openpyxl gives int64 (and the audit's string
+    comparisons see '2.0' instead of '2'). Drop the trailing blank rows, then cast complete
+    whole-number float columns back to int64.
+    """
+    filled_rows = np.flatnonzero(df.notna().any(axis=1).to_numpy())
+    df = df.iloc[:filled_rows[-1] + 1 if len(filled_rows) else 0].copy()
+    for col in df.select_dtypes(include='float').columns:
+        values = df[col]
+        if len(values) and values.notna().all() and (values == np.floor(values)).all():
+            df[col] = values.astype('int64')
+    return df
+
 def split_stay_across_months(arrival_date, departure_date, total_amount, total_nights):
     """
     Split a stay period across months, calculating nights and amount per month.
@@ -135,15 +170,16 @@ def create_monthly_matrix(df):
     logger.info(f"Created monthly matrix with amount columns: {amount_columns}")
     return pd.DataFrame(matrix_rows)
 
-def process_entered_on_report(file_path, output_csv_path=None, use_database=True):
+def process_entered_on_report(file_path, output_csv_path=None, use_database=True, file_name=None):
     """
     Process the Entered On Excel file and create expanded CSV with month splits and monthly matrix.
     Also saves data to SQLite database for persistence and tracking.
     
     Args:
-        file_path: Path to the Excel file
+        file_path: Path to the Excel file, or a binary file-like object (e.g. an upload)
         output_csv_path: Path for output CSV (optional)
         use_database: Whether to save to SQLite database (default True)
+        file_name: Name recorded for the run (defaults to the basename of file_path)
         
     Returns:
         Tuple of (DataFrame, csv_path, run_id) if use_database=True
@@ -152,18 +188,20 @@ def process_entered_on_report(file_path, output_csv_path=None, use_database=True
     run_id = None
     db = None
     start_time = datetime.now()
+    if file_name is None:
+        file_name = os.path.basename(file_path)
     
     try:
-        logger.info(f"Processing Entered On report from: {file_path}")
+        logger.info(f"Processing Entered On report from: {file_name}")
         
         # Initialize database if requested
         if use_database:
             db = AuditDatabase()
-            run_id = db.start_run(excel_file=os.path.basename(file_path))
+            run_id = db.start_run(excel_file=file_name)
             logger.info(f"Started database run: {run_id}")
         
         # Read the ENTERED ON sheet
-        df = pd.read_excel(file_path, sheet_name='ENTERED ON')
+        df = read_entered_on_sheet(file_path)
         logger.info(f"Loaded {len(df)} records from ENTERED ON sheet")
         
         # Fill empty C_T_S_NAME values with "Brand.com" (don't rename column)
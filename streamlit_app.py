@@ -16,15 +16,42 @@ import json
 import re
 import pdfplumber
 import io
+import gzip
+import hashlib
+import threading
+import zipfile
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from dataclasses import dataclass
 import win32com.client
 import pythoncom
+import pywintypes
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
 
 # Import our existing converter and database operations
 from entered_on_converter import process_entered_on_report, get_summary_stats
 from database_operations import AuditDatabase
 
 # ** RULE ENGINE FOR TRAVEL AGENCY DETECTION **
+
+# Rule plans per (C_T_S name, lowercased sender). Everything except the email text is known
+# from those two, so each plan is the list of text checks still able to change the result,
+# in chain order, plus the rule that applies when none of them hits.
+_RULE_PLANS = {}
+_RULE_PLANS_MAX = 1024
+
 def get_travel_agency_rule(c_t_s_name, sender_email="", text=""):
     """
     Determine which parser rule to use based on Travel Agency C_T_S name and content
@@ -33,139 +60,115 @@ def get_travel_agency_rule(c_t_s_name, sender_email="", text=""):
     
     # Clean the C_T_S name for comparison
     c_t_s_clean = str(c_t_s_name).strip() if c_t_s_name else ""
+    sender_lower = sender_email.lower() if sender_email else ""
+    
+    plan = _RULE_PLANS.get((c_t_s_clean, sender_lower))
+    if plan is None:
+        if len(_RULE_PLANS) >= _RULE_PLANS_MAX:
+            _RULE_PLANS.clear()
+        plan = _RULE_PLANS[(c_t_s_clean, sender_lower)] = _travel_agency_rule_plan(c_t_s_clean, sender_lower)
+    
+    text_checks, default_rule = plan
+    # The text is only lowercased and scanned when a check is left that depends on it
+    if text_checks and text:
+        text_lower = text.lower()
+        for keywords, rule in text_checks:
+            if any(keyword in text_lower for keyword in keywords):
+                return rule
+    return default_rule
+
+def _travel_agency_rule_plan(c_t_s_clean, sender_lower):
+    """Rule chain for a cleaned C_T_S name and lowercased sender as (text_checks, default_rule).
+    Each chain step is (matches without the text, text keywords, rule); the chain is cut at the
+    first step that matches without the text, since the text cannot change the result after it."""
+    c_t_s_lower = c_t_s_clean.lower()
     
     # INNLINKWAY Rules - for C_T_S names starting with "T-"
-    if c_t_s_clean.startswith("T-") or "noreply-reservations@millenniumhotels.com" in sender_email.lower():
+    if c_t_s_clean.startswith("T-") or "noreply-reservations@millenniumhotels.com" in sender_lower:
         insert_user = "*INNLINK2WAY*"
-        
-        # T-Agoda
-        if ("agoda" in c_t_s_clean.lower() or 
-            "agoda" in text.lower() or 
-            "t- agoda" in text.lower()):
-            return ("INNLINKWAY_AGODA", "Rules/INNLINKWAY/Agoda", insert_user)
-        
-        # T-Booking.com
-        elif ("booking.com" in c_t_s_clean.lower() or 
-              "booking.com" in text.lower() or 
-              "t- booking.com" in text.lower()):
-            return ("INNLINKWAY_BOOKING", "Rules/INNLINKWAY/Booking.com", insert_user)
-        
-        # T-Brand.com
-        elif ("brand.com" in c_t_s_clean.lower() or 
-              "brand.com" in text.lower() or 
-              "t- brand.com" in text.lower()):
-            return ("INNLINKWAY_BRAND", "Rules/INNLINKWAY/Brand.com", insert_user)
-        
-        # T-Expedia
-        elif ("expedia" in c_t_s_clean.lower() or 
-              "expedia" in text.lower() or 
-              "t- expedia" in text.lower()):
-            return ("INNLINKWAY_EXPEDIA", "Rules/INNLINKWAY/Expedia", insert_user)
-        
+        steps = [
+            # T-Agoda
+            ("agoda" in c_t_s_lower, ("agoda", "t- agoda"),
+             ("INNLINKWAY_AGODA", "Rules/INNLINKWAY/Agoda", insert_user)),
+            # T-Booking.com
+            ("booking.com" in c_t_s_lower, ("booking.com", "t- booking.com"),
+             ("INNLINKWAY_BOOKING", "Rules/INNLINKWAY/Booking.com", insert_user)),
+            # T-Brand.com
+            ("brand.com" in c_t_s_lower, ("brand.com", "t- brand.com"),
+             ("INNLINKWAY_BRAND", "Rules/INNLINKWAY/Brand.com", insert_user)),
+            # T-Expedia
+            ("expedia" in c_t_s_lower, ("expedia", "t- expedia"),
+             ("INNLINKWAY_EXPEDIA", "Rules/INNLINKWAY/Expedia", insert_user)),
+        ]
         # Default INNLINKWAY rule (fallback to Brand.com logic)
-        else:
-            return ("INNLINKWAY_DEFAULT", "Rules/INNLINKWAY/Brand.com", insert_user)
+        fallback = ("INNLINKWAY_DEFAULT", "Rules/INNLINKWAY/Brand.com", insert_user)
     
     # Travel Agency Rules - Traditional travel agencies
     elif c_t_s_clean:
         insert_user = c_t_s_clean  # Use actual company name as INSERT_USER
-        
-        # Travco
-        if ("travco" in c_t_s_clean.lower() or 
-            "travco.co.uk" in sender_email.lower() or
-            "hotel booking confirmation" in text.lower()):
-            return ("TRAVEL_AGENCY_TRAVCO", "Rules/Travel Agency TO/Travco", insert_user)
-        
-        # Dubai Link
-        elif ("dubai link" in c_t_s_clean.lower() or 
-              "gte.travel" in sender_email.lower() or
-              "dubai link" in text.lower()):
-            return ("TRAVEL_AGENCY_DUBAI_LINK", "Rules/Travel Agency TO/Dubai Link", insert_user)
-        
-        # Nirvana
-        elif ("nirvana" in c_t_s_clean.lower() or 
-              "nirvana" in sender_email.lower() or
-              "booking confirmed" in text.lower()):
-            return ("TRAVEL_AGENCY_NIRVANA", "Rules/Travel Agency TO/Nirvana", insert_user)
-        
-        # Dakkak DMC / Duri Travel
-        elif ("dakkak" in c_t_s_clean.lower() or 
-              "dakkak" in sender_email.lower() or
-              "dakkak dmc" in text.lower()):
-            return ("TRAVEL_AGENCY_DAKKAK", "Rules/Travel Agency TO/Dakkak", insert_user)
-        
-        # Duri
-        elif ("duri" in c_t_s_clean.lower() or 
-              "hanmail.net" in sender_email.lower() or
-              "duri travel" in text.lower()):
-            return ("TRAVEL_AGENCY_DURI", "Rules/Travel Agency TO/Duri", insert_user)
-        
-        # AlKhalidiah
-        elif ("alkhalidiah" in c_t_s_clean.lower() or 
-              "alkhalidiah.com" in sender_email.lower() or
-              "al khalidiah" in text.lower()):
-            return ("TRAVEL_AGENCY_ALKHALIDIAH", "Rules/Travel Agency TO/AlKhalidiah", insert_user)
-        
-        # Desert Adventures
-        elif ("desert adventures" in c_t_s_clean.lower() or
-              "allocation notification" in text.lower()):
-            return ("TRAVEL_AGENCY_DESERT_ADVENTURES", "Rules/Travel Agency TO/Desert Adventures", insert_user)
-        
-        # Desert Gate
-        elif ("desert gate" in c_t_s_clean.lower() or
-              "dgt" in sender_email.lower() or
-              "booking notification" in text.lower()):
-            return ("TRAVEL_AGENCY_DESERT_GATE", "Rules/Travel Agency TO/Desert Gate", insert_user)
-        
-        # Darina
-        elif ("darina" in c_t_s_clean.lower() or
-              "booking form" in text.lower()):
-            return ("TRAVEL_AGENCY_DARINA", "Rules/Travel Agency TO/Darina", insert_user)
-        
-        # Ease My Trip
-        elif ("ease my trip" in c_t_s_clean.lower() or
-              "paid booking" in text.lower()):
-            return ("TRAVEL_AGENCY_EASE_MY_TRIP", "Rules/Travel Agency TO/Ease My Trip", insert_user)
-        
-        # Almosafer
-        elif ("almosafer" in c_t_s_clean.lower() or
-              "confirmed booking" in text.lower()):
-            return ("TRAVEL_AGENCY_ALMOSAFER", "Rules/Travel Agency TO/Almosafer", insert_user)
-        
-        # Webbeds
-        elif ("webbeds" in c_t_s_clean.lower() or
-              "webbeds" in sender_email.lower() or
-              "htl-wbd" in text.lower() or
-              "booking confirmed from allocation" in text.lower()):
-            return ("TRAVEL_AGENCY_WEBBEDS", "Rules/Travel Agency TO/Webbeds", insert_user)
-        
+        steps = [
+            # Travco
+            ("travco" in c_t_s_lower or "travco.co.uk" in sender_lower, ("hotel booking confirmation",),
+             ("TRAVEL_AGENCY_TRAVCO", "Rules/Travel Agency TO/Travco", insert_user)),
+            # Dubai Link
+            ("dubai link" in c_t_s_lower or "gte.travel" in sender_lower, ("dubai link",),
+             ("TRAVEL_AGENCY_DUBAI_LINK", "Rules/Travel Agency TO/Dubai Link", insert_user)),
+            # Nirvana
+            ("nirvana" in c_t_s_lower or "nirvana" in sender_lower, ("booking confirmed",),
+             ("TRAVEL_AGENCY_NIRVANA", "Rules/Travel Agency TO/Nirvana", insert_user)),
+            # Dakkak DMC / Duri Travel
+            ("dakkak" in c_t_s_lower or "dakkak" in sender_lower, ("dakkak dmc",),
+             ("TRAVEL_AGENCY_DAKKAK", "Rules/Travel Agency TO/Dakkak", insert_user)),
+            # Duri
+            ("duri" in c_t_s_lower or "hanmail.net" in sender_lower, ("duri travel",),
+             ("TRAVEL_AGENCY_DURI", "Rules/Travel Agency TO/Duri", insert_user)),
+            # AlKhalidiah
+            ("alkhalidiah" in c_t_s_lower or "alkhalidiah.com" in sender_lower, ("al khalidiah",),
+             ("TRAVEL_AGENCY_ALKHALIDIAH", "Rules/Travel Agency TO/AlKhalidiah", insert_user)),
+            # Desert Adventures
+            ("desert adventures" in c_t_s_lower, ("allocation notification",),
+             ("TRAVEL_AGENCY_DESERT_ADVENTURES", "Rules/Travel Agency TO/Desert Adventures", insert_user)),
+            # Desert Gate
+            ("desert gate" in c_t_s_lower or "dgt" in sender_lower, ("booking notification",),
+             ("TRAVEL_AGENCY_DESERT_GATE", "Rules/Travel Agency TO/Desert Gate", insert_user)),
+            # Darina
+            ("darina" in c_t_s_lower, ("booking form",),
+             ("TRAVEL_AGENCY_DARINA", "Rules/Travel Agency TO/Darina", insert_user)),
+            # Ease My Trip
+            ("ease my trip" in c_t_s_lower, ("paid booking",),
+             ("TRAVEL_AGENCY_EASE_MY_TRIP", "Rules/Travel Agency TO/Ease My Trip", insert_user)),
+            # Almosafer
+            ("almosafer" in c_t_s_lower, ("confirmed booking",),
+             ("TRAVEL_AGENCY_ALMOSAFER", "Rules/Travel Agency TO/Almosafer", insert_user)),
+            # Webbeds
+            ("webbeds" in c_t_s_lower or "webbeds" in sender_lower, ("htl-wbd", "booking confirmed from allocation"),
+             ("TRAVEL_AGENCY_WEBBEDS", "Rules/Travel Agency TO/Webbeds", insert_user)),
+        ]
         # Generic Travel Agency - fallback
-        else:
-            return ("TRAVEL_AGENCY_GENERIC", None, insert_user)
-    
-    # Airlines Rules
-    elif ("china southern" in text.lower() or 
-          "c- china southern" in text.lower()):
-        return ("AIRLINES_CHINA_SOUTHERN", "Rules/Airlines/China Air", "China Southern Air")
+        fallback = ("TRAVEL_AGENCY_GENERIC", None, insert_user)
     
-    # UPS Airlines
-    elif ("ups" in c_t_s_clean.lower() or 
-          "ups" in text.lower()):
-        return ("AIRLINES_UPS", "Rules/Airlines/UPS", "UPS Airlines")
-    
-    # ASL Airlines
-    elif ("asl" in c_t_s_clean.lower() or 
-          "asl" in text.lower()):
-        return ("AIRLINES_ASL", "Rules/Airlines/ASL", "ASL Airlines")
-    
-    # Corporate or Group Rate
-    elif ("corporate" in c_t_s_clean.lower() or 
-          "grp" in c_t_s_clean.lower()):
-        return ("CORPORATE_RATE", "Rules/Corporate COR", c_t_s_clean)
-    
-    # Default - no specific rule
     else:
-        return ("DEFAULT", None, "MANUAL_ENTRY")
+        steps = [
+            # Airlines Rules
+            (False, ("china southern", "c- china southern"),
+             ("AIRLINES_CHINA_SOUTHERN", "Rules/Airlines/China Air", "China Southern Air")),
+            # UPS Airlines
+            ("ups" in c_t_s_lower, ("ups",), ("AIRLINES_UPS", "Rules/Airlines/UPS", "UPS Airlines")),
+            # ASL Airlines
+            ("asl" in c_t_s_lower, ("asl",), ("AIRLINES_ASL", "Rules/Airlines/ASL", "ASL Airlines")),
+            # Corporate or Group Rate
+            ("corporate" in c_t_s_lower or "grp" in c_t_s_lower, (),
+             ("CORPORATE_RATE", "Rules/Corporate COR", c_t_s_clean)),
+        ]
+        # Default - no specific rule
+        fallback = ("DEFAULT", None, "MANUAL_ENTRY")
+    
+    text_checks = []
+    for matches_without_text, keywords, rule in steps:
+        if matches_without_text:
+            return tuple(text_checks), rule
+        text_checks.append((keywords, rule))
+    return tuple(text_checks), fallback
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -179,6 +182,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def get_database():
+    """One AuditDatabase (schema checks run once) shared by every session; it opens a connection per call"""
+    return AuditDatabase()
+
 # Initialize session state
 if 'processed_data' not in st.session_state:
     st.session_state.processed_data = None
@@ -194,8 +202,20 @@ if 'auto_loaded' not in st.session_state:
     st.session_state.auto_loaded = False
 if 'current_run_id' not in st.session_state:
     st.session_state.current_run_id = None
+if 'data_summary' not in st.session_state:
+    st.session_state.data_summary = None
+if 'audit_future' not in st.session_state:
+    st.session_state.audit_future = None
+if 'cleanup_future' not in st.session_state:
+    st.session_state.cleanup_future = None
+if 'background_executor' not in st.session_state:
+    # Per session, so a job never queues behind another user's; two workers so this
+    # session's audit and cleanup can run at the same time
+    st.session_state.background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="background")
+if 'email_export' not in st.session_state:
+    st.session_state.email_export = None
 if 'database' not in st.session_state:
-    st.session_state.database = AuditDatabase()
+    st.session_state.database = get_database()
 
 # Helper functions for email processing using Outlook COM
 def connect_to_outlook():
@@ -209,6 +229,41 @@ def connect_to_outlook():
         logger.error(f"Outlook connection failed: {e}")
         return None, None
 
+def _iter_pdf_page_texts(pdf_bytes, max_pages):
+    """Yield (page_num, page_text) for the first max_pages pages.
+    Uses PDFium's native text extraction when pypdfium2 is installed, pdfplumber otherwise."""
+    if PDFIUM_AVAILABLE:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            page_count = len(pdf)
+            logger.info(f"PDF has {page_count} pages")
+            for page_num in range(min(max_pages, page_count)):
+                try:
+                    page = pdf[page_num]
+                    textpage = page.get_textpage()
+                    # PDFium separates lines with CRLF; the extraction patterns expect \n
+                    page_text = textpage.get_text_range().replace('\r\n', '\n')
+                    textpage.close()
+                    page.close()
+                except Exception as e:
+                    logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
+                    continue
+                yield page_num, page_text
+        finally:
+            pdf.close()
+        return
+    
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        page_count = len(pdf.pages)
+        logger.info(f"PDF has {page_count} pages")
+        for page_num, page in enumerate(pdf.pages[:max_pages]):
+            try:
+                page_text = page.extract_text()
+            except Exception as e:
+                logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
+                continue
+            yield page_num, page_text
+
 def extract_pdf_text(pdf_bytes):
     """Extract text from PDF bytes with enhanced error handling and performance optimizations"""
     try:
@@ -217,31 +272,19 @@ def extract_pdf_text(pdf_bytes):
             logger.warning(f"Skipping large PDF ({len(pdf_bytes) / (1024*1024):.1f}MB) - too large for processing")
             return ""
         
-        pdf_file = io.BytesIO(pdf_bytes)
         text = ""
         
-        with pdfplumber.open(pdf_file) as pdf:
-            page_count = len(pdf.pages)
-            logger.info(f"PDF has {page_count} pages")
-            
-            # Limit processing to first 3 pages for performance
-            max_pages = min(3, page_count)
-            
-            for page_num, page in enumerate(pdf.pages[:max_pages]):
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"\n--- Page {page_num + 1} ---\n{page_text}"
-                        
-                        # Early exit if we found China Southern Air on first page
-                        if page_num == 0 and ("china southern" in page_text.lower() or "c- china southern" in page_text.lower()):
-                            logger.info("Found China Southern Air on first page - processing first page only")
-                            break
-                    else:
-                        logger.warning(f"No text extracted from page {page_num + 1}")
-                except Exception as e:
-                    logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
-                    continue
+        # Limit processing to first 3 pages for performance
+        for page_num, page_text in _iter_pdf_page_texts(pdf_bytes, max_pages=3):
+            if page_text:
+                text += f"\n--- Page {page_num + 1} ---\n{page_text}"
+                
+                # Early exit if we found China Southern Air on first page
+                if page_num == 0 and ("china southern" in page_text.lower() or "c- china southern" in page_text.lower()):
+                    logger.info("Found China Southern Air on first page - processing first page only")
+                    break
+            else:
+                logger.warning(f"No text extracted from page {page_num + 1}")
         
         if not text.strip():
             logger.warning("No text extracted from PDF - may be image-based")
@@ -252,6 +295,26 @@ def extract_pdf_text(pdf_bytes):
         logger.error(f"PDF extraction failed: {e}")
         return ""
 
+# SHA-1 of PDF bytes -> extracted text, so the same PDF attached to several emails
+# (resent confirmations, quotes) is parsed once per process; oldest entries are dropped first
+PDF_TEXT_CACHE_SIZE = 64
+_PDF_TEXT_CACHE = {}
+_PDF_TEXT_CACHE_LOCK = threading.Lock()
+
+def extract_pdf_text_cached(pdf_bytes):
+    """extract_pdf_text, reusing the text of an identical PDF already extracted in this process"""
+    digest = hashlib.sha1(pdf_bytes).digest()
+    with _PDF_TEXT_CACHE_LOCK:
+        text = _PDF_TEXT_CACHE.get(digest)
+    if text is not None:
+        return text
+    text = extract_pdf_text(pdf_bytes)
+    with _PDF_TEXT_CACHE_LOCK:
+        if len(_PDF_TEXT_CACHE) >= PDF_TEXT_CACHE_SIZE:
+            del _PDF_TEXT_CACHE[next(iter(_PDF_TEXT_CACHE))]
+        _PDF_TEXT_CACHE[digest] = text
+    return text
+
 # Compile regex patterns once for better performance
 import re
 
@@ -272,6 +335,24 @@ NOREPLY_PATTERNS = {
     'CONFIRMATION_SUBJECT': re.compile(r"confirmation number[:]*\s*([A-Z0-9]+)", re.IGNORECASE),
 }
 
+# Literal (lowercase) each NOREPLY pattern needs in order to match; a field whose marker is
+# missing from the lowercased text is skipped without running its regex. ROOM_TYPE has a
+# bare room-name alternative and is always searched.
+NOREPLY_MARKERS = {
+    'GUEST_NAME_FULL': 'guest name:',
+    'ARRIVAL': 'arrive:',
+    'DEPARTURE': 'depart:',
+    'NIGHTS': 'total nights',
+    'PERSONS': 'adult/children:',
+    'RATE_CODE': 'rate code:',
+    'RATE_NAME': 'rate name:',
+    'COMPANY': 'travel agent',
+    'NET_TOTAL': 'total charges:',
+    'CONFIRMATION': 'confirman:',
+    'ARRIVAL_SUBJECT': 'arrival date',
+    'CONFIRMATION_SUBJECT': 'confirmation number',
+}
+
 CHINA_SOUTHERN_PATTERNS = {
     'FULL_NAME': re.compile(r"(?:Passenger Name|Guest Name|Name)[:\s]*([A-Z][A-Za-z\s]+)(?:\n|Cabin|Flight)", re.IGNORECASE),
     'FIRST_NAME': re.compile(r"(?:First Name|Given Name)[:\s]*([A-Za-z]+)", re.IGNORECASE),
@@ -299,8 +380,100 @@ DEFAULT_PATTERNS = {
     'NET_TOTAL': re.compile(r"(?:Total|Net Total|Amount|Net Amount)[:\s]+(?:AED\s*)?([\\d,]+\.?\\d*)", re.IGNORECASE),
 }
 
+# Every field extract_reservation_fields can return: pattern captures plus derived values
+EXPECTED_FIELDS = tuple(dict.fromkeys(
+    list(NOREPLY_PATTERNS) + list(CHINA_SOUTHERN_PATTERNS) + list(DEFAULT_PATTERNS) + [
+        'FIRST_NAME', 'FULL_NAME', 'ROOM', 'RATE_CODE', 'C_T_S', 'C_T_S_NAME',
+        'NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT',
+        'NET_TOTAL_AED', 'TOTAL_AED', 'TDF_AED', 'ADR_AED', 'AMOUNT_AED', 'INSERT_USER',
+    ]
+))
+
+# Extracted dates are d/m/yyyy or m/d/yyyy with / or - separators (see the date patterns above)
+DAY_FIRST_FORMATS = ('%d/%m/%Y', '%m/%d/%Y')
+MONTH_FIRST_FORMATS = ('%m/%d/%Y', '%d/%m/%Y')
+
+def reformat_date(value, month_first=False):
+    """Re-emit an extracted date as dd/mm/yyyy, trying the preferred day order first; None if not a valid date"""
+    normalized = value.strip().replace('-', '/')
+    for date_format in (MONTH_FIRST_FORMATS if month_first else DAY_FIRST_FORMATS):
+        try:
+            return datetime.strptime(normalized, date_format).strftime('%d/%m/%Y')
+        except ValueError:
+            continue
+    return None
+
+# Plain amount with optional thousands separators and at most one decimal point ("1.2.3" is rejected)
+AMOUNT_RE = re.compile(r'-?\d[\d,]*(?:\.\d*)?')
+
+def parse_money(value):
+    """Parse an extracted amount like '1,234.50' to a float; None if it is not a plain number"""
+    text = str(value).strip()
+    return float(text.replace(',', '')) if AMOUNT_RE.fullmatch(text) else None
+
+# Agency parsers live in folders whose names contain spaces and dots ("Travel Agency TO",
+# "Booking.com"), so they are loaded by file path once and cached instead of via sys.path
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Rules')
+_PARSER_MODULES = {}
+
+def _load_parser(*parts):
+    """Load a parser module from Rules/<parts...>.py once and return the cached module"""
+    module = _PARSER_MODULES.get(parts)
+    if module is not None:
+        return module
+    *rule_dirs, module_name = parts
+    module_path = os.path.join(RULES_DIR, *rule_dirs, f"{module_name}.py")
+    if not os.path.exists(module_path):
+        raise ImportError(f"No parser module at {module_path}")
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _PARSER_MODULES[parts] = module
+    return module
+
+# INNLINKWAY parser objects compile their pattern tables in __init__ and hold no other
+# state, so one instance per class is built and reused for every email
+_PARSER_INSTANCES = {}
+
+def _get_parser_instance(*parts):
+    """Return a shared instance of class parts[-1] from the parser module Rules/<parts[:-1]...>.py"""
+    instance = _PARSER_INSTANCES.get(parts)
+    if instance is None:
+        *module_parts, class_name = parts
+        parser_class = getattr(_load_parser(*module_parts), class_name, None)
+        if parser_class is None:
+            raise ImportError(f"{class_name} not found in {module_parts[-1]}")
+        instance = parser_class()
+        _PARSER_INSTANCES[parts] = instance
+    return instance
+
+@dataclass(slots=True)
+class EmailCtx:
+    """Email text and sender with their lowercased forms, computed once per email"""
+    text: str
+    text_lc: str
+    sender_email: str
+    sender_lc: str
+    is_innlinkway: bool
+
+    @classmethod
+    def from_email(cls, text, sender_email=""):
+        text = text or ""
+        sender_email = sender_email or ""
+        sender_lc = sender_email.lower()
+        return cls(text, text.lower(), sender_email, sender_lc,
+                   "noreply-reservations@millenniumhotels.com" in sender_lc)
+
 def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
     """Extract reservation fields using rule-based parser selection for better performance"""
+    return extract_reservation_fields_from_ctx(EmailCtx.from_email(text, sender_email), c_t_s_name)
+
+def extract_reservation_fields_from_ctx(ctx, c_t_s_name=""):
+    """Extract reservation fields from a prepared EmailCtx"""
+    text = ctx.text
+    sender_email = ctx.sender_email
+    text_lc = ctx.text_lc
+    sender_lc = ctx.sender_lc
     
     # Use rule engine to determine which parser to use
     rule_type, parser_path, insert_user = get_travel_agency_rule(c_t_s_name, sender_email, text)
@@ -309,13 +482,11 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
     logger.info(f"Rule engine selected: {rule_type} for C_T_S: {c_t_s_name}, Email: {sender_email}")
     
     # Check for Travco emails first
-    if "travco.co.uk" in sender_email.lower() or "travco@travco" in sender_email.lower() or "hotel booking confirmation" in text.lower():
+    if "travco.co.uk" in sender_lc or "travco@travco" in sender_lc or "hotel booking confirmation" in text_lc:
         # Import Travco parser
-        import sys
-        import os
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'Travel Agency TO', 'Travco'))
         try:
-            from travco_parser import extract_travco_fields, is_travco_email
+            travco_parser = _load_parser('Travel Agency TO', 'Travco', 'travco_parser')
+            extract_travco_fields, is_travco_email = travco_parser.extract_travco_fields, travco_parser.is_travco_email
             
             if is_travco_email(sender_email, text):
                 travco_fields = extract_travco_fields(text, "")
@@ -348,13 +519,11 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             logger.warning("Travco parser not found, falling back to default patterns")
     
     # Check for Dubai Link emails
-    if "gte.travel" in sender_email.lower() or "dubai link" in text.lower():
+    if "gte.travel" in sender_lc or "dubai link" in text_lc:
         # Import Dubai Link parser
-        import sys
-        import os
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'Travel Agency TO', 'Dubai Link'))
         try:
-            from dubai_link_parser import extract_dubai_link_fields, is_dubai_link_email
+            dubai_link_parser = _load_parser('Travel Agency TO', 'Dubai Link', 'dubai_link_parser')
+            extract_dubai_link_fields, is_dubai_link_email = dubai_link_parser.extract_dubai_link_fields, dubai_link_parser.is_dubai_link_email
             
             if is_dubai_link_email(sender_email, text):
                 dubai_fields = extract_dubai_link_fields(text, "")
@@ -387,13 +556,11 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             logger.warning("Dubai Link parser not found, falling back to default patterns")
     
     # Check for Nirvana emails
-    if "nirvana" in sender_email.lower() or "booking confirmed" in text.lower() or "sb25" in text.lower():
+    if "nirvana" in sender_lc or "booking confirmed" in text_lc or "sb25" in text_lc:
         # Import Nirvana parser
-        import sys
-        import os
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'Travel Agency TO', 'Nirvana'))
         try:
-            from nirvana_parser import extract_nirvana_fields, is_nirvana_email
+            nirvana_parser = _load_parser('Travel Agency TO', 'Nirvana', 'nirvana_parser')
+            extract_nirvana_fields, is_nirvana_email = nirvana_parser.extract_nirvana_fields, nirvana_parser.is_nirvana_email
             
             if is_nirvana_email(sender_email, text):
                 nirvana_fields = extract_nirvana_fields(text, "")
@@ -426,13 +593,11 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             logger.warning("Nirvana parser not found, falling back to default patterns")
     
     # Check for Duri Travel / Dakkak DMC emails
-    if "dakkak" in sender_email.lower() or "dakkak dmc" in text.lower() or "hotel new booking" in text.lower() and "bkgho" in text.lower():
+    if "dakkak" in sender_lc or "dakkak dmc" in text_lc or "hotel new booking" in text_lc and "bkgho" in text_lc:
         # Import Duri Travel parser
-        import sys
-        import os
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'Travel Agency TO', 'Duri Travel'))
         try:
-            from duri_travel_parser import extract_duri_travel_fields, is_duri_travel_email
+            duri_travel_parser = _load_parser('Travel Agency TO', 'Duri Travel', 'duri_travel_parser')
+            extract_duri_travel_fields, is_duri_travel_email = duri_travel_parser.extract_duri_travel_fields, duri_travel_parser.is_duri_travel_email
             
             if is_duri_travel_email(sender_email, text):
                 duri_fields = extract_duri_travel_fields(text, "")
@@ -465,13 +630,11 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             logger.warning("Duri Travel parser not found, falling back to default patterns")
     
     # Check for Duri emails
-    if "hanmail.net" in sender_email.lower() or "duri travel" in text.lower() or ("grand millennium dubai" in text.lower() and "jmc57" in sender_email.lower()):
+    if "hanmail.net" in sender_lc or "duri travel" in text_lc or ("grand millennium dubai" in text_lc and "jmc57" in sender_lc):
         # Import Duri parser
-        import sys
-        import os
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'Travel Agency TO', 'Duri'))
         try:
-            from duri_parser import extract_duri_fields, is_duri_email
+            duri_parser = _load_parser('Travel Agency TO', 'Duri', 'duri_parser')
+            extract_duri_fields, is_duri_email = duri_parser.extract_duri_fields, duri_parser.is_duri_email
             
             if is_duri_email(sender_email, text):
                 duri_fields = extract_duri_fields(text, "")
@@ -504,13 +667,11 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             logger.warning("Duri parser not found, falling back to default patterns")
     
     # Check for AlKhalidiah Tourism emails
-    if "alkhalidiah.com" in sender_email.lower() or "alkhalidiah" in text.lower() or "al khalidiah" in text.lower():
+    if "alkhalidiah.com" in sender_lc or "alkhalidiah" in text_lc or "al khalidiah" in text_lc:
         # Import AlKhalidiah parser
-        import sys
-        import os
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'Travel Agency TO', 'AlKhalidiah'))
         try:
-            from alkhalidiah_parser import extract_alkhalidiah_fields, is_alkhalidiah_email
+            alkhalidiah_parser = _load_parser('Travel Agency TO', 'AlKhalidiah', 'alkhalidiah_parser')
+            extract_alkhalidiah_fields, is_alkhalidiah_email = alkhalidiah_parser.extract_alkhalidiah_fields, alkhalidiah_parser.is_alkhalidiah_email
             
             if is_alkhalidiah_email(sender_email, text):
                 alkhalidiah_fields = extract_alkhalidiah_fields(text, "")
@@ -543,13 +704,11 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             logger.warning("AlKhalidiah parser not found, falling back to default patterns")
     
     # Check for Webbeds emails
-    if "webbeds" in sender_email.lower() or "htl-wbd" in text.lower() or "booking confirmed from allocation" in text.lower():
+    if "webbeds" in sender_lc or "htl-wbd" in text_lc or "booking confirmed from allocation" in text_lc:
         # Import Webbeds parser
-        import sys
-        import os
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'Travel Agency TO', 'Webbeds'))
         try:
-            from webbeds_parser import extract_webbeds_fields, is_webbeds_email
+            webbeds_parser = _load_parser('Travel Agency TO', 'Webbeds', 'webbeds_parser')
+            extract_webbeds_fields, is_webbeds_email = webbeds_parser.extract_webbeds_fields, webbeds_parser.is_webbeds_email
             
             if is_webbeds_email(sender_email, text):
                 webbeds_fields = extract_webbeds_fields(text, "")
@@ -583,17 +742,12 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
     
     # ** INNLINKWAY PARSERS INTEGRATION **
     # Check for INNLINKWAY emails (noreply-reservations@millenniumhotels.com)
-    if "noreply-reservations@millenniumhotels.com" in sender_email.lower():
+    if ctx.is_innlinkway:
         
         # T-Agoda parser
-        if ("agoda" in text.lower() or "t- agoda" in text.lower() or "confirmation number" in text.lower()):
-            import sys
-            import os
-            sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'INNLINKWAY', 'Agoda'))
+        if ("agoda" in text_lc or "t- agoda" in text_lc or "confirmation number" in text_lc):
             try:
-                from agoda_parser import AgodaParser
-                
-                parser = AgodaParser()
+                parser = _get_parser_instance('INNLINKWAY', 'Agoda', 'agoda_parser', 'AgodaParser')
                 agoda_fields = parser.parse_agoda_email(text, sender_email)
                 # Map Agoda fields to the expected field names used in the app
                 mapped_fields = {
@@ -624,14 +778,9 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
                 logger.warning("Agoda INNLINKWAY parser not found, falling back to default patterns")
         
         # T-Booking.com parser
-        elif ("booking.com" in text.lower() or "t- booking.com" in text.lower()):
-            import sys
-            import os
-            sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'INNLINKWAY', 'Booking.com'))
+        elif ("booking.com" in text_lc or "t- booking.com" in text_lc):
             try:
-                from booking_com_parser import BookingComParser
-                
-                parser = BookingComParser()
+                parser = _get_parser_instance('INNLINKWAY', 'Booking.com', 'booking_com_parser', 'BookingComParser')
                 booking_fields = parser.parse_booking_email(text, sender_email)
                 # Map Booking.com fields to the expected field names used in the app
                 mapped_fields = {
@@ -662,14 +811,9 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
                 logger.warning("Booking.com INNLINKWAY parser not found, falling back to default patterns")
         
         # T-Brand.com parser
-        elif ("brand.com" in text.lower() or "t- brand.com" in text.lower()):
-            import sys
-            import os
-            sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'INNLINKWAY', 'Brand.com'))
+        elif ("brand.com" in text_lc or "t- brand.com" in text_lc):
             try:
-                from brand_com_parser import BrandComParser
-                
-                parser = BrandComParser()
+                parser = _get_parser_instance('INNLINKWAY', 'Brand.com', 'brand_com_parser', 'BrandComParser')
                 brand_fields = parser.parse_brand_email(text, sender_email)
                 # Map Brand.com fields to the expected field names used in the app
                 mapped_fields = {
@@ -700,14 +844,9 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
                 logger.warning("Brand.com INNLINKWAY parser not found, falling back to default patterns")
         
         # T-Expedia parser
-        elif ("expedia" in text.lower() or "t- expedia" in text.lower()):
-            import sys
-            import os
-            sys.path.append(os.path.join(os.path.dirname(__file__), 'Rules', 'INNLINKWAY', 'Expedia'))
+        elif ("expedia" in text_lc or "t- expedia" in text_lc):
             try:
-                from expedia_parser import ExpediaParser
-                
-                parser = ExpediaParser()
+                parser = _get_parser_instance('INNLINKWAY', 'Expedia', 'expedia_parser', 'ExpediaParser')
                 expedia_fields = parser.parse_expedia_email(text, sender_email)
                 # Map Expedia fields to the expected field names used in the app
                 mapped_fields = {
@@ -738,26 +877,28 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
                 logger.warning("Expedia INNLINKWAY parser not found, falling back to default patterns")
     
     # Select pattern set based on email source for faster processing
-    if "noreply-reservations@millenniumhotels.com" in sender_email.lower():
+    if ctx.is_innlinkway:
         patterns = NOREPLY_PATTERNS
-    elif "c- china southern air" in text.lower() or "china southern" in text.lower():
+    elif "c- china southern air" in text_lc or "china southern" in text_lc:
         patterns = CHINA_SOUTHERN_PATTERNS  
     else:
         patterns = DEFAULT_PATTERNS
     
-    extracted = {}
+    # Preallocate every field as N/A so the dict is sized once up front
+    extracted = dict.fromkeys(EXPECTED_FIELDS, "N/A")
     
     # Extract all fields using pre-compiled patterns
+    markers = NOREPLY_MARKERS if patterns is NOREPLY_PATTERNS else {}
     for field, compiled_pattern in patterns.items():
+        marker = markers.get(field)
+        if marker is not None and marker not in text_lc:
+            continue
         match = compiled_pattern.search(text)
         if match:
-            value = match.group(1).strip()
-            extracted[field] = value
-        else:
-            extracted[field] = "N/A"
+            extracted[field] = match.group(1).strip()
     
     # Special processing for noreply-reservations emails
-    if "noreply-reservations@millenniumhotels.com" in sender_email.lower():
+    if ctx.is_innlinkway:
         # Process guest name - split "Boaz Avital" into first name and last name
         guest_name = extracted.get('GUEST_NAME_FULL', 'N/A')
         if guest_name != 'N/A' and guest_name.strip():
@@ -821,36 +962,12 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             extracted['RATE_CODE'] = 'N/A'
     
     # Convert dates to dd/mm/yyyy format - Enhanced logic for INNLINK2WAY
+    # INNLINK2WAY and noreply-reservations emails carry mm/dd/yyyy dates; everything else is dd/mm/yyyy first
+    month_first = ctx.is_innlinkway or "innlink2way" in sender_lc
     for date_field in ['ARRIVAL', 'DEPARTURE', 'ARRIVAL_SUBJECT']:
         if date_field in extracted and extracted[date_field] != 'N/A':
-            try:
-                original_date = extracted[date_field]
-                
-                # Special handling for INNLINK2WAY and noreply-reservations emails
-                if ("noreply-reservations@millenniumhotels.com" in sender_email.lower() or 
-                    "innlink2way" in sender_email.lower()):
-                    # For INNLINK2WAY, dates are typically in mm/dd/yyyy format that need conversion
-                    try:
-                        # First try parsing as mm/dd/yyyy (dayfirst=False)
-                        parsed_date = pd.to_datetime(original_date, dayfirst=False)
-                        extracted[date_field] = parsed_date.strftime('%d/%m/%Y')
-                        continue
-                    except:
-                        pass
-                
-                # Default: try dd/mm/yyyy format first
-                try:
-                    parsed_date = pd.to_datetime(original_date, dayfirst=True)
-                    extracted[date_field] = parsed_date.strftime('%d/%m/%Y')
-                except:
-                    # Fallback: try mm/dd/yyyy format
-                    try:
-                        parsed_date = pd.to_datetime(original_date, dayfirst=False)
-                        extracted[date_field] = parsed_date.strftime('%d/%m/%Y')
-                    except:
-                        pass  # Keep original value if all parsing fails
-            except:
-                pass
+            # Keep original value if neither day order gives a valid date
+            extracted[date_field] = reformat_date(extracted[date_field], month_first) or extracted[date_field]
     
     # Use arrival from subject if main arrival not found
     if extracted.get('ARRIVAL', 'N/A') == 'N/A' and extracted.get('ARRIVAL_SUBJECT', 'N/A') != 'N/A':
@@ -858,22 +975,22 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
     
     # ** OTA-SPECIFIC CALCULATIONS **
     # Check if this is from INNLINKWAY (noreply-reservations@millenniumhotels.com)
-    is_innlinkway = "noreply-reservations@millenniumhotels.com" in sender_email.lower()
+    is_innlinkway = ctx.is_innlinkway
     
     # Check if this is a T-Agoda or T-Expedia reservation (NET_TOTAL logic)
     is_agoda_expedia = ("agoda" in extracted.get('COMPANY', '').lower() or 
-                       "agoda" in text.lower() or
-                       "t- agoda" in text.lower() or
+                       "agoda" in text_lc or
+                       "t- agoda" in text_lc or
                        "expedia" in extracted.get('COMPANY', '').lower() or 
-                       "expedia" in text.lower() or
-                       "t- expedia" in text.lower())
+                       "expedia" in text_lc or
+                       "t- expedia" in text_lc)
     
     # Check if this should follow Booking.com logic (TOTAL logic)
     # Rule: Any INNLINKWAY reservation NOT from Agoda/Expedia follows Booking.com logic
     is_booking_logic = (is_innlinkway and not is_agoda_expedia) or (
                        "booking.com" in extracted.get('COMPANY', '').lower() or 
-                       "booking.com" in text.lower() or
-                       "t- booking.com" in text.lower())
+                       "booking.com" in text_lc or
+                       "t- booking.com" in text_lc)
     
     # Calculate TDF as nights × 20
     try:
@@ -886,7 +1003,7 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
         else:
             extracted['TDF'] = "N/A"
             tdf_amount = 0
-    except:
+    except (ValueError, TypeError, KeyError):
         extracted['TDF'] = "N/A"
         tdf_amount = 0
     
@@ -895,10 +1012,8 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
         # Booking.com Logic: Email amount is MAIL_TOTAL (includes TDF)
         # Applies to: T-Booking.com, Brand.com, and any INNLINKWAY non-Agoda/Expedia
         try:
-            total_charges = extracted.get('NET_TOTAL', 'N/A')  # This is actually TOTAL for booking logic
-            if total_charges != 'N/A':
-                total_amount = float(str(total_charges).replace(',', ''))
-                
+            total_amount = parse_money(extracted.get('NET_TOTAL', 'N/A'))  # This is actually TOTAL for booking logic
+            if total_amount is not None:
                 # For Booking Logic: MAIL_TOTAL = email amount (includes TDF)
                 extracted['TOTAL'] = str(total_amount)
                 
@@ -926,17 +1041,15 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
                 extracted['TOTAL'] = "N/A"
                 extracted['AMOUNT'] = "N/A"
                 extracted['ADR'] = "N/A"
-        except:
+        except (ValueError, TypeError, KeyError):
             extracted['TOTAL'] = "N/A"
             extracted['AMOUNT'] = "N/A"
             extracted['ADR'] = "N/A"
     elif is_agoda_expedia and is_innlinkway:
         # T-Agoda/T-Expedia: Email amount is MAIL_NET_TOTAL (excludes TDF)
         try:
-            net_charges = extracted.get('NET_TOTAL', 'N/A')  # This is NET_TOTAL for agoda/expedia
-            if net_charges != 'N/A':
-                net_total_amount = float(str(net_charges).replace(',', ''))
-                
+            net_total_amount = parse_money(extracted.get('NET_TOTAL', 'N/A'))  # This is NET_TOTAL for agoda/expedia
+            if net_total_amount is not None:
                 # For T-Agoda/T-Expedia: MAIL_NET_TOTAL = email amount (excludes TDF)
                 extracted['NET_TOTAL'] = str(net_total_amount)
                 
@@ -965,7 +1078,7 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
                 extracted['TOTAL'] = "N/A"
                 extracted['AMOUNT'] = "N/A"
                 extracted['ADR'] = "N/A"
-        except:
+        except (ValueError, TypeError, KeyError):
             extracted['NET_TOTAL'] = "N/A"
             extracted['TOTAL'] = "N/A"
             extracted['AMOUNT'] = "N/A"
@@ -974,12 +1087,10 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
         # Default calculation for other OTAs (Expedia, Agoda, etc.)
         # Calculate ADR (Average Daily Rate) = NET_TOTAL / NIGHTS
         try:
-            net_total = extracted.get('NET_TOTAL', 'N/A')
+            net_total_num = parse_money(extracted.get('NET_TOTAL', 'N/A'))
             nights = extracted.get('NIGHTS', 'N/A')
-            if (net_total != 'N/A' and nights != 'N/A' and 
-                str(nights).isdigit() and str(net_total).replace(',', '').replace('.', '').isdigit()):
+            if net_total_num is not None and str(nights).isdigit():
                 nights_num = int(nights)
-                net_total_num = float(str(net_total).replace(',', ''))
                 if nights_num > 0:
                     adr = net_total_num / nights_num
                     extracted['ADR'] = f"{adr:.2f}"
@@ -988,14 +1099,14 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
                     extracted['ADR'] = "N/A"
             else:
                 extracted['ADR'] = "N/A"
-        except:
+        except (ValueError, TypeError, KeyError):
             extracted['ADR'] = "N/A"
         
         # Set AMOUNT = NET_TOTAL for consistency (other OTAs)
         try:
             net_total = extracted.get('NET_TOTAL', 'N/A')
-            if net_total != 'N/A':
-                amount_num = float(str(net_total).replace(',', ''))
+            amount_num = parse_money(net_total)
+            if amount_num is not None:
                 extracted['AMOUNT'] = net_total
                 extracted['AMOUNT_AED'] = f"AED {amount_num:,.2f}"
                 # For non-booking.com, TOTAL = NET_TOTAL + TDF
@@ -1004,12 +1115,12 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             else:
                 extracted['AMOUNT'] = "N/A"
                 extracted['TOTAL'] = "N/A"
-        except:
+        except (ValueError, TypeError, KeyError):
             extracted['AMOUNT'] = "N/A"
             extracted['TOTAL'] = "N/A"
     
     # Special handling for China Southern Air reservations
-    if "c- china southern air" in text.lower() or "china southern" in text.lower():
+    if "c- china southern air" in text_lc or "china southern" in text_lc:
         extracted['C_T_S'] = "C- China Southern Air"
         extracted['C_T_S_NAME'] = "C- China Southern Air"
         extracted['COMPANY'] = "C- China Southern Air"
@@ -1027,7 +1138,7 @@ def extract_reservation_fields(text, sender_email="", c_t_s_name=""):
             extracted['C_T_S_NAME'] = "N/A"
     
     # Add INSERT_USER using rule engine if not already set
-    if 'INSERT_USER' not in extracted:
+    if extracted['INSERT_USER'] == 'N/A':
         rule_type, parser_path, insert_user = get_travel_agency_rule(
             extracted.get('C_T_S_NAME', c_t_s_name), sender_email, text
         )
@@ -1057,7 +1168,7 @@ def get_rule_based_search_folders(rule_type, outlook, namespace):
                     folder_name = folder.Name.lower()
                     if any(keyword in folder_name for keyword in ['innlink', 'millennium', 'booking', 'reservation']):
                         folders_to_search.append(folder)
-            except:
+            except (AttributeError, pywintypes.com_error):
                 pass
         
         elif rule_type.startswith("TRAVEL_AGENCY"):
@@ -1067,7 +1178,7 @@ def get_rule_based_search_folders(rule_type, outlook, namespace):
                     folder_name = folder.Name.lower()
                     if any(keyword in folder_name for keyword in ['travel', 'agency', 'booking', 'tour']):
                         folders_to_search.append(folder)
-            except:
+            except (AttributeError, pywintypes.com_error):
                 pass
         
         elif rule_type.startswith("AIRLINES"):
@@ -1077,14 +1188,14 @@ def get_rule_based_search_folders(rule_type, outlook, namespace):
                     folder_name = folder.Name.lower()
                     if any(keyword in folder_name for keyword in ['airline', 'flight', 'air']):
                         folders_to_search.append(folder)
-            except:
+            except (AttributeError, pywintypes.com_error):
                 pass
         
         # Always include sent items for outbound correspondence
         try:
             sent_items = namespace.GetDefaultFolder(5)  # 5 = olFolderSentMail
             folders_to_search.append(sent_items)
-        except:
+        except (AttributeError, pywintypes.com_error):
             pass
             
         return folders_to_search
@@ -1094,7 +1205,7 @@ def get_rule_based_search_folders(rule_type, outlook, namespace):
         # Fallback to just inbox
         try:
             return [namespace.GetDefaultFolder(6)]
-        except:
+        except (AttributeError, pywintypes.com_error):
             return []
 
 def get_current_mailbox_info(outlook, namespace):
@@ -1113,10 +1224,101 @@ def get_current_mailbox_info(outlook, namespace):
         logger.warning(f"Could not get current mailbox info: {e}")
         return None, None
 
+# id(namespace) -> (namespace, store); the mailbox does not change within a run
+_MAILBOX_STORE_CACHE = {}
+
+def get_search_store(outlook, namespace):
+    """Resolve the store to search (current mailbox, else the default inbox's store) once per namespace"""
+    cached = _MAILBOX_STORE_CACHE.get(id(namespace))
+    if cached is not None and cached[0] is namespace:
+        return cached[1]
+    
+    current_folder, store = get_current_mailbox_info(outlook, namespace)
+    if not store:
+        # Fallback to default inbox if we can't get current mailbox
+        inbox = namespace.GetDefaultFolder(6)  # 6 = olFolderInbox
+        store = inbox.Store
+    
+    _MAILBOX_STORE_CACHE[id(namespace)] = (namespace, store)
+    return store
+
+@dataclass(slots=True)
+class NameMatcher:
+    """Guest name words mapped to guest keys, with an optional Aho-Corasick automaton over them"""
+    words: dict
+    automaton: object
+    keys: frozenset
+
+def build_name_matcher(guests):
+    """
+    Build one matcher for many guests from (key, guest_name, first_name) tuples.
+    Name parts and first names longer than 2 characters are indexed, each mapping
+    to the set of keys it belongs to. Uses an Aho-Corasick automaton when
+    pyahocorasick is installed so every email is scanned in a single pass.
+    """
+    words = {}
+    for key, guest_name, first_name in guests:
+        if guest_name and guest_name.strip():
+            for part in guest_name.casefold().split():
+                if len(part) > 2:
+                    words.setdefault(part, set()).add(key)
+        if first_name and first_name.strip():
+            first_name_folded = first_name.casefold()
+            if len(first_name_folded) > 2:
+                words.setdefault(first_name_folded, set()).add(key)
+    
+    all_keys = frozenset(key for keys in words.values() for key in keys)
+    if not AHOCORASICK_AVAILABLE or not words:
+        return NameMatcher(words, None, all_keys)
+    
+    automaton = ahocorasick.Automaton()
+    for word, keys in words.items():
+        automaton.add_word(word, keys)
+    automaton.make_automaton()
+    return NameMatcher(words, automaton, all_keys)
+
+def match_guest_names(name_matcher, *texts):
+    """Return the set of guest keys whose names appear in any of the given texts"""
+    hits = set()
+    if not name_matcher.words:
+        return hits
+    for text in texts:
+        if not text:
+            continue
+        text_folded = text.casefold()
+        if name_matcher.automaton is None:
+            for word, keys in name_matcher.words.items():
+                if word in text_folded:
+                    hits.update(keys)
+        else:
+            for _, keys in name_matcher.automaton.iter(text_folded):
+                hits.update(keys)
+    return hits
+
 def search_all_folders_in_mailbox(store, guest_name, first_name="", days=2):
     """Search specific folders in the current mailbox for a specific guest
     Focus on: 2025\\Aug, 2025\\July, Groups, 0 OTA Notification, Inbox folders"""
+    name_matcher = build_name_matcher([(guest_name, guest_name, first_name)])
     all_matching_emails = []
+    for email_info, _ in search_mailbox_for_guests(store, name_matcher, days):
+        email_info['matched_reservation'] = guest_name
+        all_matching_emails.append(email_info)
+    return all_matching_emails
+
+def search_mailbox_for_guests(store, name_matcher, days=2, db=None):
+    """Walk the priority folders of a mailbox once and match every email against all guests
+    in name_matcher. Returns (email_info, matched_keys) pairs; matched_keys is None for
+    reservations mailbox emails, which apply to every guest."""
+    all_matching_emails = []
+    
+    # PDF text extraction overlaps with the Outlook walk below
+    pdf_batch = PdfBatch()
+    # Cached extractions for the whole search window, read in one query
+    email_cache = EmailCache(db, days) if db else None
+    
+    # Date window evaluated by the store; only items inside it cross the COM boundary
+    since_date = (datetime.now() - timedelta(days=days)).strftime("%m/%d/%Y")
+    date_filter = f"[ReceivedTime] >= '{since_date}' OR [SentOn] >= '{since_date}'"
     
     def search_folder_recursive(folder, depth=0):
         nonlocal all_matching_emails
@@ -1147,14 +1349,17 @@ def search_all_folders_in_mailbox(store, guest_name, first_name="", days=2):
             if should_search:
                 items = folder.Items
                 
-                if len(items) > 0:
-                    # Apply date filter (2 days)
-                    since_date = (datetime.now() - timedelta(days=days)).strftime("%m/%d/%Y")
+                if items.Count > 0:
+                    # Apply date filter, newest first
                     try:
-                        filtered_items = items.Restrict(f'[ReceivedTime] >= "{since_date}" OR [SentOn] >= "{since_date}"')
-                        
-                        # Search through filtered items using both full name and first name
-                        matches_in_folder = search_items_in_folder_for_guest(filtered_items, folder.Name, guest_name, first_name)
+                        try:
+                            matches_in_folder = search_folder_table(folder, date_filter, name_matcher, email_cache, pdf_batch)
+                        except pywintypes.com_error as e:
+                            # Some stores do not support folder tables; walk the restricted items instead
+                            logger.warning(f"Folder table unavailable for {folder.Name}, using Items: {e}")
+                            filtered_items = items.Restrict(date_filter)
+                            filtered_items.Sort("[ReceivedTime]", True)
+                            matches_in_folder = search_items_in_folder(filtered_items, folder.Name, name_matcher, email_cache, pdf_batch)
                         all_matching_emails.extend(matches_in_folder)
                         
                         if matches_in_folder:
@@ -1177,150 +1382,356 @@ def search_all_folders_in_mailbox(store, guest_name, first_name="", days=2):
         search_folder_recursive(root_folder)
     except Exception as e:
         logger.error(f"Could not access root folder: {e}")
+    finally:
+        pdf_batch.finish()
+        if email_cache is not None:
+            email_cache.flush()
     
+    format_currency_fields(email_info['extracted_data'] for email_info, _ in all_matching_emails)
     return all_matching_emails
 
-def search_items_in_folder_for_guest(items, folder_name, guest_name, first_name=""):
+def search_items_in_folder_for_guest(items, folder_name, guest_name, first_name="", name_matcher=None):
     """Search for matching items in a specific folder for a guest using both full name and first name"""
+    if name_matcher is None:
+        name_matcher = build_name_matcher([(guest_name, guest_name, first_name)])
+    matching_emails = []
+    for email_info, _ in search_items_in_folder(items, folder_name, name_matcher):
+        email_info['matched_reservation'] = guest_name
+        matching_emails.append(email_info)
+    format_currency_fields(email_info['extracted_data'] for email_info in matching_emails)
+    return matching_emails
+
+def search_items_in_folder(items, folder_name, name_matcher, email_cache=None, pdf_batch=None):
+    """Search a folder's items once for every guest in name_matcher.
+    Returns (email_info, matched_keys) pairs; matched_keys is None for reservations mailbox emails."""
+    matching_emails = []
+    
+    # GetFirst/GetNext walks the collection without Python iterator overhead on the COM object
+    item = items.GetFirst()
+    while item is not None:
+        match = match_email_item(item, folder_name, name_matcher, email_cache=email_cache, pdf_batch=pdf_batch)
+        if match:
+            matching_emails.append(match)
+        item = items.GetNext()
+    
+    return matching_emails
+
+# Header columns pulled in bulk from Folder.GetTable, in GetValues() order
+_TABLE_COLUMNS = ("EntryID", "Subject", "SenderEmailAddress", "SenderName", "ReceivedTime")
+
+class LazyMailItem:
+    """Stand-in for an Outlook item found through a folder Table: the item is bound with
+    GetItemFromID on the first attribute read (Body, Attachments), so rows that are decided
+    from their Table headers alone never open the item"""
+    
+    __slots__ = ('_session', '_entry_id', '_store_id', '_item')
+    
+    def __init__(self, session, entry_id, store_id):
+        self._session = session
+        self._entry_id = entry_id
+        self._store_id = store_id
+        self._item = None
+    
+    def __getattr__(self, name):
+        if self._item is None:
+            self._item = self._session.GetItemFromID(self._entry_id, self._store_id)
+        return getattr(self._item, name)
+
+def search_folder_table(folder, date_filter, name_matcher, email_cache=None, pdf_batch=None):
+    """Search a folder through its Outlook Table so header properties come back in one
+    row fetch instead of one COM call each; the MailItem is only bound (LazyMailItem)
+    when Body or Attachments are actually read.
+    Returns (email_info, matched_keys) pairs like search_items_in_folder."""
     matching_emails = []
     
-    for item in items:
+    table = folder.GetTable(date_filter)
+    table.Columns.RemoveAll()
+    for column in _TABLE_COLUMNS:
+        table.Columns.Add(column)
+    table.Sort("[ReceivedTime]", True)
+    
+    session = folder.Session
+    store_id = folder.StoreID
+    folder_name = folder.Name
+    while not table.EndOfTable:
+        row = table.GetNextRow()
+        entry_id, subject, sender_email, sender_name, received_time = row.GetValues()
+        # Items that fail to bind are skipped by match_email_item's error handling
+        item = LazyMailItem(session, entry_id, store_id)
+        headers = (subject or '', sender_email or '', sender_name or '', received_time or '')
+        match = match_email_item(item, folder_name, name_matcher, headers, email_cache, entry_id, pdf_batch)
+        if match:
+            matching_emails.append(match)
+    
+    return matching_emails
+
+# Hotel senders handled specially during the mailbox walk (matched against the casefolded sender)
+RESERVATIONS_SENDER = 'reservations.gmhd@millenniumhotels.com'
+NOREPLY_RESERVATIONS_SENDER = 'noreply-reservations@millenniumhotels.com'
+
+# MAPI property holding an attachment's raw bytes
+PR_ATTACH_DATA_BIN = "http://schemas.microsoft.com/mapi/proptag/0x37010102"
+
+def read_attachment_bytes(attachment, filename):
+    """Read an Outlook attachment's bytes in memory, falling back to a temp file via SaveAsFile"""
+    try:
+        return bytes(attachment.PropertyAccessor.GetProperty(PR_ATTACH_DATA_BIN))
+    except (AttributeError, pywintypes.com_error) as e:
+        logger.debug(f"PropertyAccessor read failed for {filename}, saving to disk: {e}")
+    
+    # Save attachment temporarily with safe filename
+    safe_name = filename.replace(' ', '_').replace('/', '_').replace('\\', '_')
+    temp_path = os.path.join(os.getcwd(), f"temp_{safe_name}")
+    try:
+        attachment.SaveAsFile(temp_path)
+        if not os.path.exists(temp_path):
+            return None
+        with open(temp_path, 'rb') as f:
+            return f.read()
+    finally:
+        # Clean up temp file
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except Exception as cleanup_error:
+                logger.warning(f"Could not clean up temp file {temp_path}: {cleanup_error}")
+
+# Amount fields that get an "AED 1,234.00" display copy under FIELD_AED
+CURRENCY_FIELDS = ('NET', 'NET_TOTAL', 'TDF', 'AMOUNT', 'TOTAL')
+
+# Everything that is not part of a plain decimal number (currency codes, separators, spaces)
+CURRENCY_CLEAN_RE = re.compile(r'[^0-9.\-]')
+
+def parse_amounts(values):
+    """Parse a Series of amounts (numbers, or strings like 'AED 1,234.50') to floats; NaN where unparseable"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    return pd.to_numeric(values.astype(str).str.replace(CURRENCY_CLEAN_RE, '', regex=True), errors='coerce')
+
+def format_aed(values):
+    """Format a Series of amounts (numbers or strings with thousands separators) as AED strings; NaN where unparseable"""
+    return parse_amounts(values).map('AED {:,.2f}'.format, na_action='ignore')
+
+def format_currency_fields(extracted_records):
+    """Add FIELD_AED display values to a batch of extracted_data dicts in one pass per field"""
+    records = [record for record in extracted_records if record]
+    if not records:
+        return
+    frame = pd.DataFrame.from_records(records, columns=list(CURRENCY_FIELDS))
+    for field in CURRENCY_FIELDS:
+        for record, value in zip(records, format_aed(frame[field])):
+            if isinstance(value, str):
+                record[f'{field}_AED'] = value
+
+def apply_pdf_text(email_info, filename, pdf_size, text, sender_email):
+    """Extract reservation fields from a PDF's text and record the attachment on email_info"""
+    if text and len(text.strip()) > 10:  # Minimum text threshold
+        logger.info(f"Extracted {len(text)} characters from PDF")
+        # Currency display fields are added for the whole batch by format_currency_fields
+        extracted_fields = extract_reservation_fields(text, sender_email)
+        email_info['extracted_data'] = extracted_fields
+        email_info['attachments'].append({
+            'filename': filename,
+            'size': pdf_size,
+            'text_extracted': True,
+            'text_length': len(text),
+            'contains_china_southern': 'china southern' in text.lower()
+        })
+        logger.info(f"Successfully processed PDF: {filename}")
+    else:
+        logger.warning(f"Insufficient text extracted from PDF: {filename}")
+        email_info['attachments'].append({
+            'filename': filename,
+            'size': pdf_size,
+            'text_extracted': False,
+            'error': 'No readable text found'
+        })
+
+class PdfBatch:
+    """
+    Runs PDF text extraction on a background thread while the caller keeps walking
+    Outlook. Only attachment bytes cross threads; COM objects stay on the calling
+    thread. A single worker is used because PDFium is not thread-safe, and the
+    overlap with Outlook round-trips is where the time is saved.
+    """
+    
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf")
+        self.jobs = []
+    
+    def submit(self, email_info, filename, pdf_data, sender_email):
+        """Queue a PDF for text extraction; fields are applied to email_info in finish()"""
+        future = self.pool.submit(extract_pdf_text_cached, pdf_data)
+        self.jobs.append((email_info, filename, len(pdf_data), future, sender_email))
+    
+    def finish(self):
+        """Wait for queued PDFs and apply their fields in submission order"""
+        self.pool.shutdown(wait=True)
+        for email_info, filename, pdf_size, future, sender_email in self.jobs:
+            try:
+                apply_pdf_text(email_info, filename, pdf_size, future.result(), sender_email)
+            except Exception as e:
+                logger.warning(f"Error processing PDF {filename}: {e}")
+        self.jobs = []
+
+# Bump when extraction patterns, parsers or field post-processing change, so emails cached
+# by earlier code are extracted again instead of being served from email_cache
+EXTRACTION_VERSION = '1'
+
+class EmailCache:
+    """
+    Extraction results of emails seen in earlier runs, keyed by Outlook EntryID and received
+    time. The rows for EXTRACTION_VERSION inside the search window are read in one query when
+    the search starts; new results are collected and written in one executemany by flush(),
+    which runs after PdfBatch.finish() so queued PDF fields are included.
+    """
+    
+    def __init__(self, db, days):
+        self.db = db
+        self.pending = []
+        try:
+            self.rows = db.load_email_cache(EXTRACTION_VERSION, days)
+        except sqlite3.Error as e:
+            logger.warning(f"Email cache load failed: {e}")
+            self.rows = {}
+    
+    def get(self, entry_id, received_time):
+        """Cached {'extracted_data', 'attachments'} for an email, or None if not cached or changed"""
+        row = self.rows.get(entry_id)
+        if row is not None and row[0] == received_time:
+            return json.loads(row[1])
+        return None
+    
+    def put(self, entry_id, received_time, email_info):
+        """Queue an email's results; they are read from email_info when flush() runs"""
+        self.pending.append((entry_id, received_time, email_info))
+    
+    def flush(self):
+        """Write every queued email's results in one transaction"""
+        if not self.pending:
+            return
+        records = [
+            (entry_id, received_time, {
+                'extracted_data': email_info['extracted_data'],
+                'attachments': email_info['attachments']
+            })
+            for entry_id, received_time, email_info in self.pending
+        ]
+        self.pending = []
         try:
+            self.db.put_cached_emails(records, EXTRACTION_VERSION)
+        except sqlite3.Error as e:
+            logger.warning(f"Email cache write failed: {e}")
+
+def extract_email_item_data(item, email_info, subject, body, sender_email, pdf_batch=None, sender_lc=None):
+    """Fill email_info['extracted_data'] and ['attachments'] from the email body and PDF attachments.
+    body may be None if it has not been fetched yet; sender_lc is the casefolded sender if already known.
+    With a pdf_batch, PDF text extraction is queued and applied when the batch finishes."""
+    if sender_lc is None:
+        sender_lc = sender_email.casefold()
+    
+    # For noreply-reservations emails, extract data from the email body and subject
+    if NOREPLY_RESERVATIONS_SENDER in sender_lc:
+        if body is None:
+            body = getattr(item, 'Body', '') or ''
+        # Combine subject and body for extraction
+        full_content = subject + "\n" + body
+        email_info['extracted_data'] = extract_reservation_fields(full_content, sender_email)
+    
+    # Process PDF attachments if present
+    if hasattr(item, 'Attachments') and item.Attachments.Count > 0:
+        for attachment in item.Attachments:
+            filename = getattr(attachment, 'FileName', '')
+            
+            if filename and filename.lower().endswith('.pdf'):
+                try:
+                    logger.info(f"Processing PDF attachment: {filename}")
+                    pdf_data = read_attachment_bytes(attachment, filename)
+                    
+                    if pdf_data is None:
+                        logger.error(f"Failed to save PDF attachment: {filename}")
+                    elif pdf_batch is not None:
+                        logger.info(f"PDF size: {len(pdf_data)} bytes")
+                        pdf_batch.submit(email_info, filename, pdf_data, sender_email)
+                    else:
+                        logger.info(f"PDF size: {len(pdf_data)} bytes")
+                        apply_pdf_text(email_info, filename, len(pdf_data), extract_pdf_text_cached(pdf_data), sender_email)
+                
+                except Exception as e:
+                    logger.warning(f"Error processing PDF {filename}: {e}")
+            else:
+                email_info['attachments'].append({
+                    'filename': filename,
+                    'type': 'non-pdf'
+                })
+
+def match_email_item(item, folder_name, name_matcher, headers=None, email_cache=None, entry_id=None, pdf_batch=None):
+    """Match one Outlook item against every guest in name_matcher and extract its data.
+    headers optionally carries (subject, sender_email, sender_name, received_time) already
+    read from a folder Table. With an email_cache (EmailCache), extraction results are cached per EntryID.
+    With a pdf_batch, PDF attachments are parsed in the background (see PdfBatch).
+    Returns (email_info, matched_keys) or None."""
+    try:
+        if headers is None:
             # Check if this is an email item
             if not hasattr(item, 'Subject'):
-                continue
+                return None
             
             # Get email properties
             sender_email = getattr(item, 'SenderEmailAddress', '') or ''
             sender_name = getattr(item, 'SenderName', '') or ''
             subject = getattr(item, 'Subject', '') or ''
-            body = getattr(item, 'Body', '') or ''
             received_time = getattr(item, 'ReceivedTime', '') or getattr(item, 'SentOn', '')
+        else:
+            subject, sender_email, sender_name, received_time = headers
+        
+        # Check which guests this email matches (full name parts or first name), headers first
+        matched_keys = match_guest_names(name_matcher, subject, sender_email, sender_name)
+        
+        # Also check for specific senders (always include reservation emails)
+        sender_lc = sender_email.casefold()
+        is_reservations_email = RESERVATIONS_SENDER in sender_lc
+        
+        # Body is the most expensive property; only fetch it when it can still add guests
+        body = None
+        if not is_reservations_email and matched_keys != name_matcher.keys:
+            body = getattr(item, 'Body', '') or ''
+            matched_keys |= match_guest_names(name_matcher, body)
+        
+        if matched_keys or is_reservations_email:
+            email_info = {
+                'subject': subject,
+                'sender': sender_email,
+                'sender_name': sender_name,
+                'received_time': received_time,
+                'attachments': [],
+                'extracted_data': {},
+                'matched_reservation': '',
+                'folder': folder_name
+            }
             
-            # Check if this email matches our guest criteria
-            email_text = (subject + ' ' + body + ' ' + sender_email + ' ' + sender_name).lower()
-            
-            # Look for both full name and first name variations
-            name_found = False
-            
-            # Search by full name (FULL_NAME column)
-            if guest_name and guest_name.strip():
-                guest_name_lower = guest_name.lower()
-                name_parts = guest_name_lower.split()
-                name_found = any(part in email_text for part in name_parts if len(part) > 2)
+            # Reuse extraction results from earlier runs, keyed by Outlook EntryID
+            if email_cache is not None and not entry_id:
+                entry_id = getattr(item, 'EntryID', '') or ''
+            cached = None
+            if email_cache is not None and entry_id:
+                cached = email_cache.get(entry_id, str(received_time))
             
-            # Search by first name (FIRST_NAME column)
-            if not name_found and first_name and first_name.strip():
-                first_name_lower = first_name.lower()
-                if len(first_name_lower) > 2:
-                    name_found = first_name_lower in email_text
+            if cached is not None:
+                # Seen in a previous run and unchanged; skip body extraction and PDF parsing
+                email_info['extracted_data'] = cached.get('extracted_data', {})
+                email_info['attachments'] = cached.get('attachments', [])
+            else:
+                extract_email_item_data(item, email_info, subject, body, sender_email, pdf_batch, sender_lc)
+                if email_cache is not None and entry_id:
+                    email_cache.put(entry_id, str(received_time), email_info)
             
-            # Also check for specific senders (always include reservation emails)
-            is_reservations_email = 'reservations.gmhd@millenniumhotels.com' in sender_email.lower()
+            return email_info, None if is_reservations_email else matched_keys
             
-            if name_found or is_reservations_email:
-                email_info = {
-                    'subject': subject,
-                    'sender': sender_email,
-                    'sender_name': sender_name,
-                    'received_time': received_time,
-                    'attachments': [],
-                    'extracted_data': {},
-                    'matched_reservation': guest_name,
-                    'folder': folder_name
-                }
-                
-                # For noreply-reservations emails, extract data from the email body and subject
-                if "noreply-reservations@millenniumhotels.com" in sender_email.lower():
-                    # Combine subject and body for extraction
-                    full_content = subject + "\n" + body
-                    extracted_fields = extract_reservation_fields(full_content, sender_email)
-                    email_info['extracted_data'] = extracted_fields
-                    
-                    # Format currency fields
-                    for field in ['NET_TOTAL', 'TDF']:
-                        if extracted_fields.get(field) != 'N/A' and extracted_fields.get(field):
-                            try:
-                                amount = float(str(extracted_fields[field]).replace(',', ''))
-                                extracted_fields[f'{field}_AED'] = f"AED {amount:,.2f}"
-                            except:
-                                pass
-                
-                # Process PDF attachments if present
-                if hasattr(item, 'Attachments') and item.Attachments.Count > 0:
-                    for attachment in item.Attachments:
-                        filename = getattr(attachment, 'FileName', '')
-                        
-                        if filename and filename.lower().endswith('.pdf'):
-                            try:
-                                # Save attachment temporarily with safe filename
-                                safe_filename = f"temp_{filename.replace(' ', '_').replace('/', '_').replace('\\', '_')}"
-                                temp_path = os.path.join(os.getcwd(), safe_filename)
-                                
-                                logger.info(f"Processing PDF attachment: {filename}")
-                                attachment.SaveAsFile(temp_path)
-                                
-                                if os.path.exists(temp_path):
-                                    with open(temp_path, 'rb') as f:
-                                        pdf_data = f.read()
-                                        logger.info(f"PDF size: {len(pdf_data)} bytes")
-                                        text = extract_pdf_text(pdf_data)
-                                        
-                                        if text and len(text.strip()) > 10:  # Minimum text threshold
-                                            logger.info(f"Extracted {len(text)} characters from PDF")
-                                            extracted_fields = extract_reservation_fields(text, sender_email)
-                                            
-                                            # Format currency fields including NET
-                                            for field in ['NET', 'NET_TOTAL', 'TDF', 'AMOUNT', 'TOTAL']:
-                                                if extracted_fields.get(field) != 'N/A' and extracted_fields.get(field):
-                                                    try:
-                                                        amount_str = str(extracted_fields[field]).replace(',', '')
-                                                        amount = float(amount_str)
-                                                        extracted_fields[f'{field}_AED'] = f"AED {amount:,.2f}"
-                                                    except ValueError:
-                                                        logger.warning(f"Could not parse currency field {field}: {extracted_fields[field]}")
-                                            
-                                            email_info['extracted_data'] = extracted_fields
-                                            email_info['attachments'].append({
-                                                'filename': filename,
-                                                'size': len(pdf_data),
-                                                'text_extracted': True,
-                                                'text_length': len(text),
-                                                'contains_china_southern': 'china southern' in text.lower()
-                                            })
-                                            logger.info(f"Successfully processed PDF: {filename}")
-                                        else:
-                                            logger.warning(f"Insufficient text extracted from PDF: {filename}")
-                                            email_info['attachments'].append({
-                                                'filename': filename,
-                                                'size': len(pdf_data),
-                                                'text_extracted': False,
-                                                'error': 'No readable text found'
-                                            })
-                                else:
-                                    logger.error(f"Failed to save PDF attachment: {filename}")
-                                
-                                # Clean up temp file
-                                if os.path.exists(temp_path):
-                                    try:
-                                        os.remove(temp_path)
-                                    except Exception as cleanup_error:
-                                        logger.warning(f"Could not clean up temp file {temp_path}: {cleanup_error}")
-                                    
-                            except Exception as e:
-                                logger.warning(f"Error processing PDF {filename}: {e}")
-                        else:
-                            email_info['attachments'].append({
-                                'filename': filename,
-                                'type': 'non-pdf'
-                            })
-                
-                matching_emails.append(email_info)
-                
-        except Exception as e:
-            continue  # Skip problematic items
+    except Exception as e:
+        pass  # Skip problematic items
     
-    return matching_emails
+    return None
 
 def search_emails_for_reservation(outlook, namespace, reservation_data, days=2):
     """Search emails for a specific reservation using guest name and dates - Enhanced with current mailbox search"""
@@ -1333,13 +1744,7 @@ def search_emails_for_reservation(outlook, namespace, reservation_data, days=2):
         if not guest_name and not first_name:
             return []
         
-        # Get current mailbox info
-        current_folder, store = get_current_mailbox_info(outlook, namespace)
-        
-        if not store:
-            # Fallback to default inbox if we can't get current mailbox
-            inbox = namespace.GetDefaultFolder(6)  # 6 = olFolderInbox
-            store = inbox.Store
+        store = get_search_store(outlook, namespace)
         
         # Search specific folders in the current mailbox (2025\Aug, 2025\July, Groups, Inbox)
         matching_emails = search_all_folders_in_mailbox(store, guest_name, first_name, days)
@@ -1350,16 +1755,57 @@ def search_emails_for_reservation(outlook, namespace, reservation_data, days=2):
         logger.error(f"Error searching emails for {guest_name}: {e}")
         return []
 
+def search_emails_for_reservations(outlook, namespace, reservations_df, days=2, db=None):
+    """Search the current mailbox once for every reservation in the DataFrame.
+    Returns {reservation index: [email_info, ...]}"""
+    emails_by_reservation = {}
+    guests = {}
+    no_names = pd.Series('', index=reservations_df.index)
+    full_names = reservations_df['FULL_NAME'] if 'FULL_NAME' in reservations_df else no_names
+    first_names = reservations_df['FIRST_NAME'] if 'FIRST_NAME' in reservations_df else no_names
+    for idx, guest_name, first_name in zip(reservations_df.index, full_names, first_names):
+        guest_name = guest_name.strip() if isinstance(guest_name, str) else ''
+        first_name = first_name.strip() if isinstance(first_name, str) else ''
+        if guest_name or first_name:
+            guests[idx] = (guest_name, first_name)
+    
+    if not guests:
+        return emails_by_reservation
+    
+    try:
+        store = get_search_store(outlook, namespace)
+        
+        name_matcher = build_name_matcher((idx, guest_name, first_name) for idx, (guest_name, first_name) in guests.items())
+        found_emails = search_mailbox_for_guests(store, name_matcher, days, db)
+    except Exception as e:
+        logger.error(f"Error searching emails for reservations: {e}")
+        return emails_by_reservation
+    
+    for email_info, matched_keys in found_emails:
+        for idx in (guests if matched_keys is None else matched_keys):
+            # Each reservation gets its own copy so matched_reservation stays per guest
+            emails_by_reservation.setdefault(idx, []).append(
+                {**email_info, 'matched_reservation': guests[idx][0]}
+            )
+    
+    logger.info(f"Matched {len(found_emails)} emails across {len(emails_by_reservation)} reservations")
+    return emails_by_reservation
+
 def process_all_reservations_with_emails(outlook, namespace, reservations_df, days=7, run_id=None, db=None):
     """Process all reservations and search for matching emails"""
     results = []
     start_time = datetime.now()
     
-    for idx, reservation in reservations_df.iterrows():
-        reservation_dict = reservation.to_dict()
-        
-        # Search for emails related to this reservation
-        matching_emails = search_emails_for_reservation(outlook, namespace, reservation_dict, days)
+    # Walk the mailbox once for all reservations instead of once per reservation
+    emails_by_reservation = search_emails_for_reservations(outlook, namespace, reservations_df, days, db)
+    
+    # (C_T_S name, sender, email text) -> MAIL_ fields from the rule engine and extraction
+    rule_field_cache = {}
+    
+    # Rows as plain dicts in one pass; iterrows would build a Series per reservation
+    for idx, reservation_dict in reservations_df.to_dict('index').items():
+        # Emails related to this reservation
+        matching_emails = emails_by_reservation.get(idx, [])
         
         # Combine reservation data with email findings
         result = {
@@ -1367,7 +1813,7 @@ def process_all_reservations_with_emails(outlook, namespace, reservations_df, da
             'reservation_data': reservation_dict,
             'matching_emails': matching_emails,
             'email_count': len(matching_emails),
-            'has_pdf_data': any(email.get('extracted_data') for email in matching_emails),
+            'has_pdf_data': False,  # set during the merge pass below
             'status': 'EMAIL_FOUND' if matching_emails else 'NO_EMAIL_FOUND'
         }
         
@@ -1375,6 +1821,8 @@ def process_all_reservations_with_emails(outlook, namespace, reservations_df, da
         if matching_emails:
             for email in matching_emails:
                 if email.get('extracted_data'):
+                    result['has_pdf_data'] = True
+                    
                     # Merge email extracted data with reservation data
                     for field, value in email['extracted_data'].items():
                         if value != 'N/A':
@@ -1387,18 +1835,25 @@ def process_all_reservations_with_emails(outlook, namespace, reservations_df, da
                     # Get subject and body content
                     email_text = f"{email.get('subject', '')}\n{getattr(email, 'body', '')}"
                     
-                    # Use rule engine to get INSERT_USER
-                    rule_type, parser_path, insert_user = get_travel_agency_rule(c_t_s_name, sender_email, email_text)
-                    
-                    # Extract additional fields using rule-based extraction
-                    additional_fields = extract_reservation_fields(email_text, sender_email, c_t_s_name)
-                    
-                    # Add INSERT_USER to the extracted data
-                    additional_fields['INSERT_USER'] = insert_user
+                    # Emails shared across reservations (and repeat agencies) resolve once per batch
+                    cache_key = (c_t_s_name, sender_email, email_text)
+                    mail_fields = rule_field_cache.get(cache_key)
+                    if mail_fields is None:
+                        email_ctx = EmailCtx.from_email(email_text, sender_email)
+                        
+                        # Use rule engine to get INSERT_USER
+                        rule_type, parser_path, insert_user = get_travel_agency_rule(c_t_s_name, sender_email, email_text)
+                        
+                        # Extract additional fields using rule-based extraction
+                        additional_fields = extract_reservation_fields_from_ctx(email_ctx, c_t_s_name)
+                        
+                        # Add INSERT_USER to the extracted data
+                        additional_fields['INSERT_USER'] = insert_user
+                        
+                        mail_fields = {f'MAIL_{field}': value for field, value in additional_fields.items() if value != 'N/A'}
+                        rule_field_cache[cache_key] = mail_fields
                     
-                    for field, value in additional_fields.items():
-                        if value != 'N/A':
-                            result['reservation_data'][f'MAIL_{field}'] = value
+                    result['reservation_data'].update(mail_fields)
         
         results.append(result)
         
@@ -1419,6 +1874,14 @@ def process_all_reservations_with_emails(outlook, namespace, reservations_df, da
     
     return results
 
+# Field lists used by perform_audit_checks
+AUDIT_MAIL_FIELDS = ('FIRST_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM',
+                     'RATE_CODE', 'C_T_S', 'C_T_S_NAME', 'NET', 'NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT')
+AUDIT_COMPARISON_FIELDS = ('FULL_NAME', 'FIRST_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM')
+AUDIT_EMAIL_FIELDS = tuple(dict.fromkeys(AUDIT_MAIL_FIELDS + AUDIT_COMPARISON_FIELDS))
+AUDIT_REQUIRED_FIELDS = ('FULL_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS')
+AUDIT_RATE_FIELDS = ('NET_TOTAL', 'ROOM_RATE', 'ADR', 'TOTAL_AMOUNT')
+
 def perform_audit_checks(df, email_data=None, run_id=None, db=None):
     """Perform audit validation checks on the data including email extraction comparison"""
     if df is None or df.empty:
@@ -1434,141 +1897,146 @@ def perform_audit_checks(df, email_data=None, run_id=None, db=None):
     df_audit['match_percentage'] = 0
     df_audit['email_vs_data_status'] = 'N/A'
     
-    # Initialize Mail_ columns with N/A
-    mail_fields = ['FIRST_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM', 
-                 'RATE_CODE', 'C_T_S', 'C_T_S_NAME', 'NET', 'NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']
+    # Merged email extracted fields per guest, collected column by column (one list per field);
+    # later results for the same name win
+    email_columns = {f'Mail_{field}': [] for field in AUDIT_EMAIL_FIELDS}
+    guest_names = []
+    for result in email_data or []:
+        email_fields = {}
+        for email in result.get('matching_emails', []):
+            if email.get('extracted_data'):
+                email_fields.update(email['extracted_data'])
+        for field in AUDIT_EMAIL_FIELDS:
+            email_columns[f'Mail_{field}'].append(email_fields.get(field, 'N/A'))
+        guest_names.append(result['reservation_data'].get('FULL_NAME', ''))
     
-    for field in mail_fields:
-        df_audit[f'Mail_{field}'] = 'N/A'
+    # Hash join the email fields onto the audit rows (join keeps the original index)
+    df_audit = df_audit.drop(columns=[f'Mail_{field}' for field in AUDIT_MAIL_FIELDS], errors='ignore')
+    if guest_names and 'FULL_NAME' in df_audit.columns:
+        email_columns['FULL_NAME'] = guest_names
+        email_columns['_has_email'] = [True] * len(guest_names)
+        email_df = pd.DataFrame(email_columns).drop_duplicates('FULL_NAME', keep='last').set_index('FULL_NAME')
+        df_audit = df_audit.join(email_df, on='FULL_NAME')
+    for column_name in [f'Mail_{field}' for field in AUDIT_EMAIL_FIELDS]:
+        df_audit[column_name] = df_audit[column_name].fillna('N/A') if column_name in df_audit.columns else 'N/A'
+    has_email = df_audit.pop('_has_email').fillna(False).astype(bool).to_numpy() if '_has_email' in df_audit.columns else np.zeros(len(df_audit), dtype=bool)
     
-    # Create email data lookup for comparison
-    email_lookup = {}
-    if email_data:
-        for result in email_data:
-            guest_name = result['reservation_data'].get('FULL_NAME', '')
-            email_lookup[guest_name] = result
+    n_rows = len(df_audit)
+    issue_lists = [[] for _ in range(n_rows)]
+    missing = pd.Series(np.nan, index=df_audit.index, dtype=object)
     
-    for idx, row in df_audit.iterrows():
-        row_issues = []
-        
-        # Check 1: NIGHTS = Departure - Arrival (using dd/mm/yyyy format)
-        if pd.notna(row['ARRIVAL']) and pd.notna(row['DEPARTURE']):
-            try:
-                # Always use dayfirst=True for dd/mm/yyyy format
-                arrival = pd.to_datetime(row['ARRIVAL'], dayfirst=True)
-                departure = pd.to_datetime(row['DEPARTURE'], dayfirst=True)
-                calculated_nights = (departure - arrival).days
-                
-                if pd.notna(row['NIGHTS']) and abs(row['NIGHTS'] - calculated_nights) > 0:
-                    row_issues.append(f"Night calculation mismatch: Expected {calculated_nights}, got {row['NIGHTS']}")
-            except:
-                row_issues.append("Invalid date format (expected dd/mm/yyyy)")
-        
-        # Check 2: NET_TOTAL >= TDF (if both exist)
-        if pd.notna(row.get('NET_TOTAL')) and pd.notna(row.get('TDF')):
-            try:
-                net_total = float(str(row['NET_TOTAL']).replace(',', ''))
-                tdf = float(str(row['TDF']).replace(',', ''))
-                if net_total < tdf:
-                    row_issues.append(f"NET_TOTAL ({net_total}) < TDF ({tdf})")
-            except:
-                row_issues.append("Invalid numeric format for NET_TOTAL or TDF")
-        
-        # Check 3: PERSONS > 0
-        if pd.notna(row.get('PERSONS')):
-            try:
-                persons = int(row['PERSONS'])
-                if persons <= 0:
-                    row_issues.append(f"Invalid person count: {persons}")
-            except:
-                row_issues.append("Invalid person count format")
-        
-        # Check 4: Required fields present
-        required_fields = ['FULL_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS']
-        rate_fields = ['NET_TOTAL', 'ROOM_RATE', 'ADR', 'TOTAL_AMOUNT']
-        
-        for field in required_fields:
-            if pd.isna(row.get(field)) or row.get(field) == '' or row.get(field) == 'N/A':
-                row_issues.append(f"Missing required field: {field}")
-        
-        # Check 5: At least one rate field should be present
-        has_rate_info = any(pd.notna(row.get(f'MAIL_{field}')) or pd.notna(row.get(field)) 
-                           for field in rate_fields)
-        if not has_rate_info:
-            row_issues.append("Missing rate information - no rate fields found")
-        
-        # NEW: Check 6: Email extraction vs converted data comparison
-        guest_name = row.get('FULL_NAME', '')
-        if guest_name in email_lookup:
-            email_result = email_lookup[guest_name]
-            email_fields = {}
-            
-            # Gather all email extracted fields
-            for email in email_result.get('matching_emails', []):
-                if email.get('extracted_data'):
-                    email_fields.update(email['extracted_data'])
-            
-            # ADD MAIL_ COLUMNS TO AUDIT DATAFRAME
-            mail_fields = ['FIRST_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM', 
-                         'RATE_CODE', 'C_T_S', 'C_T_S_NAME', 'NET', 'NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']
-            
-            for field in mail_fields:
-                mail_col = f'Mail_{field}'
-                df_audit.at[idx, mail_col] = email_fields.get(field, 'N/A')
-            
-            # Compare fields between email extraction and converted data
-            comparison_fields = ['FULL_NAME', 'FIRST_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM']
-            matching_fields = 0
-            total_comparable_fields = 0
-            
-            for field in comparison_fields:
-                email_value = email_fields.get(field, 'N/A')
-                data_value = str(row.get(field, 'N/A'))
-                
-                if email_value != 'N/A' and data_value != 'N/A':
-                    total_comparable_fields += 1
-                    
-                    # Normalize for comparison
-                    if field in ['ARRIVAL', 'DEPARTURE']:
-                        try:
-                            # Always use dayfirst=True for dd/mm/yyyy format
-                            email_date = pd.to_datetime(email_value, dayfirst=True).strftime('%d/%m/%Y')
-                            data_date = pd.to_datetime(data_value, dayfirst=True).strftime('%d/%m/%Y')
-                            if email_date == data_date:
-                                matching_fields += 1
-                        except:
-                            pass  # Date format mismatch
-                    elif field == 'ROOM':
-                        # Special handling for ST and SK room group - they're equivalent (twin/king bed)
-                        email_room = str(email_value).lower().strip()
-                        data_room = str(data_value).lower().strip()
-                        if (email_room == data_room or 
-                            (email_room in ['st', 'sk'] and data_room in ['st', 'sk'])):
-                            matching_fields += 1
-                    elif str(email_value).lower().strip() == str(data_value).lower().strip():
-                        matching_fields += 1
-            
-            df_audit.at[idx, 'fields_matching'] = matching_fields
-            df_audit.at[idx, 'total_email_fields'] = total_comparable_fields
-            
-            if total_comparable_fields > 0:
-                match_percentage = (matching_fields / total_comparable_fields) * 100
-                df_audit.at[idx, 'match_percentage'] = match_percentage
-                
-                if match_percentage >= 80:
-                    df_audit.at[idx, 'email_vs_data_status'] = 'PASS'
-                elif match_percentage >= 60:
-                    df_audit.at[idx, 'email_vs_data_status'] = 'WARNING'
-                else:
-                    df_audit.at[idx, 'email_vs_data_status'] = 'FAIL'
-                    row_issues.append(f"Low email-data match: {match_percentage:.1f}% ({matching_fields}/{total_comparable_fields} fields)")
-            else:
-                df_audit.at[idx, 'email_vs_data_status'] = 'NO_EMAIL_DATA'
-        
-        # Update audit status
-        if row_issues:
-            df_audit.at[idx, 'audit_status'] = 'FAIL'
-            df_audit.at[idx, 'audit_issues'] = '; '.join(row_issues)
+    def column(name):
+        return df_audit[name] if name in df_audit.columns else missing
+    
+    def add_issues(mask, make_message):
+        for pos in np.flatnonzero(np.asarray(mask, dtype=bool)):
+            issue_lists[pos].append(make_message(pos))
+    
+    def to_number(values):
+        # Always float, like the old per-row float(), so issue text reads "100.0" whatever the column dtype
+        return pd.to_numeric(values.astype(str).str.replace(',', '', regex=False), errors='coerce').astype(float)
+    
+    # Check 1: NIGHTS = Departure - Arrival (using dd/mm/yyyy format)
+    arrival_raw, departure_raw = column('ARRIVAL'), column('DEPARTURE')
+    has_dates = (arrival_raw.notna() & departure_raw.notna()).to_numpy()
+    # Always use dayfirst=True for dd/mm/yyyy format
+    arrival = pd.to_datetime(arrival_raw, dayfirst=True, format='mixed', errors='coerce')
+    departure = pd.to_datetime(departure_raw, dayfirst=True, format='mixed', errors='coerce')
+    calculated_nights = (departure - arrival).dt.days.to_numpy()
+    bad_dates = has_dates & (arrival.isna() | departure.isna()).to_numpy()
+    nights_raw = column('NIGHTS')
+    nights = pd.to_numeric(nights_raw, errors='coerce').to_numpy(dtype=float)
+    # A non-numeric NIGHTS value made the old per-row subtraction fail into the invalid-date branch
+    bad_dates |= has_dates & nights_raw.notna().to_numpy() & np.isnan(nights)
+    nights_mismatch = has_dates & ~bad_dates & nights_raw.notna().to_numpy() & (np.abs(nights - calculated_nights) > 0)
+    add_issues(nights_mismatch,
+               lambda pos: f"Night calculation mismatch: Expected {int(calculated_nights[pos])}, got {nights_raw.iat[pos]}")
+    add_issues(bad_dates, lambda pos: "Invalid date format (expected dd/mm/yyyy)")
+    
+    # Check 2: NET_TOTAL >= TDF (if both exist)
+    net_total_raw, tdf_raw = column('NET_TOTAL'), column('TDF')
+    has_amounts = (net_total_raw.notna() & tdf_raw.notna()).to_numpy()
+    net_total = to_number(net_total_raw).to_numpy()
+    tdf = to_number(tdf_raw).to_numpy()
+    bad_amounts = has_amounts & (np.isnan(net_total) | np.isnan(tdf))
+    add_issues(has_amounts & ~bad_amounts & (net_total < tdf),
+               lambda pos: f"NET_TOTAL ({net_total[pos]}) < TDF ({tdf[pos]})")
+    add_issues(bad_amounts, lambda pos: "Invalid numeric format for NET_TOTAL or TDF")
+    
+    # Check 3: PERSONS > 0
+    persons_raw = column('PERSONS')
+    has_persons = persons_raw.notna().to_numpy()
+    persons = np.trunc(pd.to_numeric(persons_raw, errors='coerce').to_numpy(dtype=float))
+    bad_persons = has_persons & np.isnan(persons)
+    add_issues(has_persons & ~bad_persons & (persons <= 0),
+               lambda pos: f"Invalid person count: {int(persons[pos])}")
+    add_issues(bad_persons, lambda pos: "Invalid person count format")
+    
+    # Check 4: Required fields present
+    for field in AUDIT_REQUIRED_FIELDS:
+        values = column(field)
+        add_issues(values.isna() | values.isin(['', 'N/A']),
+                   lambda pos, field=field: f"Missing required field: {field}")
+    
+    # Check 5: At least one rate field should be present
+    has_rate_info = np.zeros(n_rows, dtype=bool)
+    for field in AUDIT_RATE_FIELDS:
+        has_rate_info |= column(f'MAIL_{field}').notna().to_numpy() | column(field).notna().to_numpy()
+    add_issues(~has_rate_info, lambda pos: "Missing rate information - no rate fields found")
+    
+    # Check 6: Email extraction vs converted data comparison
+    fields_matching = np.zeros(n_rows, dtype=int)
+    total_email_fields = np.zeros(n_rows, dtype=int)
+    
+    parsed_dates = {'ARRIVAL': arrival, 'DEPARTURE': departure}
+    
+    for field in AUDIT_COMPARISON_FIELDS:
+        email_values = df_audit[f'Mail_{field}']
+        data_values = column(field).astype(str) if field in df_audit.columns else pd.Series('N/A', index=df_audit.index)
+        comparable = has_email & (email_values != 'N/A').to_numpy() & (data_values != 'N/A').to_numpy()
+        
+        # Normalize for comparison
+        if field in ['ARRIVAL', 'DEPARTURE']:
+            # Always use dayfirst=True for dd/mm/yyyy format
+            email_dates = pd.to_datetime(email_values.where(comparable), dayfirst=True, format='mixed', errors='coerce')
+            # The data side was already parsed for the NIGHTS check
+            data_dates = parsed_dates[field].where(comparable)
+            matches = (email_dates.dt.normalize() == data_dates.dt.normalize()).to_numpy()
+        else:
+            email_norm = email_values.astype(str).str.lower().str.strip()
+            data_norm = data_values.str.lower().str.strip()
+            matches = (email_norm == data_norm).to_numpy()
+            if field == 'ROOM':
+                # Special handling for ST and SK room group - they're equivalent (twin/king bed)
+                matches |= (email_norm.isin(['st', 'sk']) & data_norm.isin(['st', 'sk'])).to_numpy()
+        
+        total_email_fields += comparable
+        fields_matching += comparable & matches
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        match_percentages = np.where(total_email_fields > 0, fields_matching / total_email_fields * 100, 0.0)
+    has_comparable = total_email_fields > 0
+    email_statuses = np.select(
+        [has_email & has_comparable & (match_percentages >= 80),
+         has_email & has_comparable & (match_percentages >= 60),
+         has_email & has_comparable,
+         has_email],
+        ['PASS', 'WARNING', 'FAIL', 'NO_EMAIL_DATA'],
+        default='N/A'
+    )
+    add_issues(email_statuses == 'FAIL',
+               lambda pos: f"Low email-data match: {match_percentages[pos]:.1f}% ({fields_matching[pos]}/{total_email_fields[pos]} fields)")
+    
+    df_audit['fields_matching'] = fields_matching
+    df_audit['total_email_fields'] = total_email_fields
+    df_audit['match_percentage'] = match_percentages
+    df_audit['email_vs_data_status'] = email_statuses
+    # Only the Mail_ fields shown in the audit are kept; the rest were comparison inputs
+    df_audit = df_audit.drop(columns=[f'Mail_{field}' for field in AUDIT_COMPARISON_FIELDS if field not in AUDIT_MAIL_FIELDS])
+    
+    # Update audit status
+    df_audit['audit_issues'] = ['; '.join(issues) for issues in issue_lists]
+    df_audit['audit_status'] = np.where([bool(issues) for issues in issue_lists], 'FAIL', 'PASS')
     
     # Save audit results to database
     if run_id and db:
@@ -1584,44 +2052,471 @@ def perform_audit_checks(df, email_data=None, run_id=None, db=None):
     return df_audit
 
 # Streamlit App
+# Low-cardinality columns used by filters and equality checks; stored as pandas categoricals
+CATEGORY_COLUMNS = ('SEASON', 'COMPANY_CLEAN', 'ROOM', 'RATE_CODE', 'C_T_S')
+
+@st.cache_data(show_spinner=False)
+def parse_entered_on_report(_source, file_key, file_name=None):
+    """Excel parse and conversion of process_entered_on_report, once per file version.
+    _source is a path or an in-memory upload and is not hashed; file_key identifies the
+    content (path, mtime and size, or a content hash) so reruns and refreshes of an
+    unchanged file reuse the processed result. No database writes happen here."""
+    processed_df, csv_path = process_entered_on_report(_source, use_database=False, file_name=file_name)
+    for column in CATEGORY_COLUMNS:
+        if column in processed_df.columns:
+            processed_df[column] = processed_df[column].astype('category')
+    return processed_df, csv_path
+
+def load_entered_on_report(source, file_key, file_name=None):
+    """Load an Entered On report (parse cached by file_key) and record it as a new run.
+    The run is started before the parse and the raw reservations saved on every load, so
+    each load gets its own run_id and a workbook that fails to parse is recorded as FAILED.
+    Returns (DataFrame, csv_path, run_id)."""
+    start_time = datetime.now()
+    db = get_database()
+    run_id = db.start_run(excel_file=file_name or os.path.basename(source))
+    logger.info(f"Started database run: {run_id}")
+    
+    try:
+        processed_df, csv_path = parse_entered_on_report(source, file_key, file_name)
+    except Exception as e:
+        logger.error(f"Error processing Entered On report: {e}")
+        try:
+            db.log_error(run_id, str(e), "process_entered_on_report")
+            db.update_run_stats(run_id, {'status': 'FAILED'})
+        except Exception:
+            pass  # Don't let database errors mask the original error
+        raise
+    
+    try:
+        saved_count = db.save_raw_reservations(processed_df, run_id)
+        logger.info(f"Saved {saved_count} reservations to database")
+        db.update_run_stats(run_id, {
+            'execution_time_seconds': (datetime.now() - start_time).total_seconds(),
+            'status': 'PROCESSING_COMPLETE'
+        })
+    except Exception as db_error:
+        logger.error(f"Database save failed: {db_error}")
+        db.log_error(run_id, str(db_error), "save_raw_reservations")
+    return processed_df, csv_path, run_id
+
+# st.fragment (Streamlit 1.37+, experimental_fragment from 1.33) reruns only its own section
+# on interaction; older versions render the section as part of the full script run
+FRAGMENT_API = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+fragment = FRAGMENT_API or (lambda func: func)
+
+# Seconds between status checks of a running background job
+JOB_POLL_SECONDS = 1
+
+def _poll_background_job(future_key, message):
+    """Job status that reruns itself every JOB_POLL_SECONDS and reruns the app once the job is done"""
+    future = st.session_state.get(future_key)
+    if future is None or future.done():
+        st.rerun()
+    st.info(message)
+
+poll_background_job = FRAGMENT_API(run_every=JOB_POLL_SECONDS)(_poll_background_job) if FRAGMENT_API else None
+
+def show_job_progress(future_key, message, button_label):
+    """Show message while the background job in st.session_state[future_key] runs; the status
+    polls itself where fragments are available, older Streamlit versions get a button instead"""
+    if poll_background_job is not None:
+        poll_background_job(future_key, message)
+    else:
+        st.info(message)
+        st.button(button_label)
+
+def get_data_summary(df):
+    """Summary metrics for the loaded data, computed once per DataFrame and kept across reruns"""
+    cached = st.session_state.data_summary
+    if cached is not None and cached[0] is df:
+        return cached[1]
+    
+    summary = {
+        'total_records': len(df),
+        'total_amount': df['AMOUNT'].sum() if 'AMOUNT' in df.columns else 0,
+        'total_nights': df['NIGHTS'].sum() if 'NIGHTS' in df.columns else 0,
+        'avg_adr': df['ADR'].mean() if 'ADR' in df.columns else 0,
+        'filter_options': {}
+    }
+    st.session_state.data_summary = (df, summary)
+    return summary
+
+def get_filter_options(df, column, filtered_df=None, selections=()):
+    """'All' plus the values of column in filtered_df (df narrowed by the earlier filter
+    selections), memoized with df's summary so reruns skip the unique() scans"""
+    filter_options = get_data_summary(df)['filter_options']
+    key = (column, selections)
+    if key not in filter_options:
+        source = df if filtered_df is None else filtered_df
+        filter_options[key] = ['All'] + list(source[column].unique())
+    return filter_options[key]
+
+def get_email_export(email_results):
+    """Email results export table, built column-wise once per email_results list and kept across reruns"""
+    cached = st.session_state.email_export
+    if cached is not None and cached[0] is email_results:
+        return cached[1]
+    
+    reservations = pd.DataFrame.from_records([result['reservation_data'] for result in email_results])
+    export_columns = {
+        export_name: reservations[field] if field in reservations.columns else ''
+        for export_name, field in [('Guest_Name', 'FULL_NAME'), ('Arrival', 'ARRIVAL'), ('Departure', 'DEPARTURE'),
+                                   ('Nights', 'NIGHTS'), ('Room', 'ROOM'), ('Amount_AED', 'AMOUNT')]
+    }
+    export_df = pd.DataFrame(export_columns, index=reservations.index)
+    export_df['Email_Status'] = [result['status'] for result in email_results]
+    export_df['Emails_Found'] = [result['email_count'] for result in email_results]
+    export_df['PDF_Data_Found'] = [result['has_pdf_data'] for result in email_results]
+    
+    # Add email extracted fields
+    email_columns = [col for col in reservations.columns if col.startswith('EMAIL_')]
+    if email_columns:
+        export_df = pd.concat([export_df, reservations[email_columns]], axis=1)
+    
+    st.session_state.email_export = (email_results, export_df)
+    return export_df
+
+@st.cache_data(ttl=30, max_entries=16, show_spinner=False)
+def get_cached_runs_page(_db, runs_version, before, limit):
+    """One page of runs, re-queried when runs_version changes or after 30s (status updates to existing runs)"""
+    return _db.get_runs_page(before=before, limit=limit)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_cached_db_summary(_db, runs_version):
+    """Database summary stats, re-queried when runs_version changes or after 60s"""
+    return _db.get_summary_stats()
+
+@st.cache_data(ttl=300, max_entries=64, show_spinner=False)
+def get_cached_run_errors(_db, run_id):
+    """Errors logged for a finished run; call the database directly for runs still in progress"""
+    return _db.get_run_errors(run_id)
+
+@st.cache_data(ttl=300, max_entries=8, show_spinner=False)
+def get_cached_run_export(_db, run_id, run_counts):
+    """Raw, email and audit tables of a finished run, fetched together so each export button
+    reuses them; run_counts (the run's logged counts) re-keys the entry if the run is saved again"""
+    return _db.export_run_tables(run_id)
+
+# audit_log counts that change whenever rows are saved for a run
+RUN_COUNT_FIELDS = ('reservations_loaded_count', 'emails_found_count', 'audit_pass_count', 'audit_fail_count')
+
+def get_run_export(db, run_details):
+    """Raw, email and audit tables of a run; cached only once the run is COMPLETED or FAILED,
+    since earlier stages still add email and audit rows"""
+    run_id = run_details['run_id']
+    if run_details.get('status') in ('COMPLETED', 'FAILED'):
+        run_counts = tuple(run_details.get(field) for field in RUN_COUNT_FIELDS)
+        return get_cached_run_export(db, run_id, run_counts)
+    return db.export_run_tables(run_id)
+
+# Run status indicators in the Logs tab; any other status shows 🟡
+RUN_STATUS_ICONS = {'COMPLETED': '🟢', 'FAILED': '🔴'}
+
+# Download formats: file extension and MIME type
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/octet-stream')
+}
+
+def export_bytes(df, export_format):
+    """Serialize a DataFrame for st.download_button in one of EXPORT_FORMATS"""
+    if export_format == 'Parquet':
+        # Mixed-type object columns (e.g. Mail_ fields) are stored as strings; Arrow needs one type per column
+        object_columns = df.select_dtypes(include='object').columns
+        buffer = io.BytesIO()
+        df.astype({column: 'string' for column in object_columns}).to_parquet(
+            buffer, engine='pyarrow', compression='snappy', index=False
+        )
+        return buffer.getvalue()
+    if export_format == 'CSV (gzip)':
+        # Level 1 keeps the gzip step cheap; mtime=0 makes repeated exports byte-identical
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=1, mtime=0) as gz:
+            df.to_csv(gz, index=False, encoding='utf-8')
+        return buffer.getvalue()
+    return csv_bytes(df)
+
+def csv_bytes(df):
+    """Encode a DataFrame as UTF-8 CSV bytes for st.download_button, writing straight into a buffer"""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
+
+def workbook_signature(file_path):
+    """(name, CRC, size) of the worksheet and shared-string parts of an .xlsx/.xlsm,
+    read from the zip central directory without decompressing anything; None if not a zip"""
+    try:
+        with zipfile.ZipFile(file_path) as workbook:
+            return tuple(
+                (info.filename, info.CRC, info.file_size) for info in workbook.infolist()
+                if info.filename.startswith('xl/worksheets/') or info.filename == 'xl/sharedStrings.xml'
+            )
+    except (zipfile.BadZipFile, OSError):
+        return None
+
+def file_version_key(file_path):
+    """Cache key for a file on disk: path plus its sheet data signature, or mtime and size
+    if the signature cannot be read. A workbook re-saved with unchanged sheets keeps its key."""
+    signature = workbook_signature(file_path)
+    if signature:
+        return file_path, signature
+    stat = os.stat(file_path)
+    return file_path, stat.st_mtime, stat.st_size
+
 def get_latest_file_from_path(base_path="P:\\Reservation\\Entered on"):
     """Get the latest .xlsm file from the latest folder in the specified path"""
     try:
         if not os.path.exists(base_path):
             return None, f"Base path does not exist: {base_path}"
         
-        # Get all directories in the base path
-        directories = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d))]
+        # Latest directory by modification time; scandir entries carry is_dir/stat from the listing
+        with os.scandir(base_path) as entries:
+            directories = [entry for entry in entries if entry.is_dir()]
         
         if not directories:
             return None, "No directories found in base path"
         
-        # Sort directories by modification time (latest first)
-        directories.sort(key=lambda x: os.path.getmtime(os.path.join(base_path, x)), reverse=True)
-        latest_dir = directories[0]
-        latest_dir_path = os.path.join(base_path, latest_dir)
+        latest_dir_entry = max(directories, key=lambda entry: entry.stat().st_mtime)
+        latest_dir = latest_dir_entry.name
+        latest_dir_path = latest_dir_entry.path
         
         # Get all .xlsm files in the latest directory, skip temporary files
-        xlsm_files = [f for f in os.listdir(latest_dir_path) 
-                     if f.lower().endswith('.xlsm') and not f.startswith('~$')]
+        with os.scandir(latest_dir_path) as entries:
+            xlsm_files = [entry for entry in entries
+                          if entry.name.lower().endswith('.xlsm') and not entry.name.startswith('~$')]
         
         if not xlsm_files:
             return None, f"No .xlsm files found in latest directory: {latest_dir}"
         
-        # Sort files by modification time (latest first)
-        xlsm_files.sort(key=lambda x: os.path.getmtime(os.path.join(latest_dir_path, x)), reverse=True)
-        latest_file = xlsm_files[0]
-        latest_file_path = os.path.join(latest_dir_path, latest_file)
+        # Latest file by modification time
+        latest_file_entry = max(xlsm_files, key=lambda entry: entry.stat().st_mtime)
+        latest_file = latest_file_entry.name
+        latest_file_path = latest_file_entry.path
         
         return latest_file_path, f"Selected: {latest_dir}\\{latest_file}"
         
     except Exception as e:
         return None, f"Error finding latest file: {e}"
 
+@fragment
+def render_logs_tab():
+    """Logs & History tab: recent runs, run details, exports and database maintenance"""
+    # One timestamp per render for every download file name
+    export_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    st.header("📝 Logs & History")
+    
+    # Recent runs section
+    st.subheader("🔄 Recent Runs")
+    
+    try:
+        runs_version = st.session_state.database.get_runs_version()
+        page_size = int(st.number_input("Rows", min_value=10, max_value=500, value=20, step=10, key="runs_page_size"))
+        
+        # Keyset paging: runs_cursor holds the (run_timestamp, run_id) cursor of every page loaded after the first;
+        # a new run or a different page size starts again from the newest page
+        if st.session_state.get('runs_cursor_key') != (runs_version, page_size):
+            st.session_state.runs_cursor_key = (runs_version, page_size)
+            st.session_state.runs_cursor = []
+        runs_pages = [
+            get_cached_runs_page(st.session_state.database, runs_version, before_ts, page_size)
+            for before in [None] + st.session_state.runs_cursor
+        ]
+        if len(runs_pages[-1]) == page_size and st.button("Load more", key="runs_load_more"):
+            last_run = runs_pages[-1].iloc[-1]
+            st.session_state.runs_cursor.append((last_run['cursor_timestamp'], last_run['run_id']))
+            runs_pages.append(get_cached_runs_page(
+                st.session_state.database, runs_version, st.session_state.runs_cursor[-1], page_size
+            ))
+        recent_runs = pd.concat(runs_pages, ignore_index=True) if len(runs_pages) > 1 else runs_pages[0]
+        
+        if not recent_runs.empty:
+            # Summary metrics for recent runs
+            status_counts = recent_runs['status'].value_counts()
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Total Runs", len(recent_runs))
+            with col2:
+                completed_runs = int(status_counts.get('COMPLETED', 0))
+                st.metric("Completed", completed_runs)
+            with col3:
+                failed_runs = int(status_counts.get('FAILED', 0))
+                st.metric("Failed", failed_runs, delta=f"{failed_runs}" if failed_runs > 0 else None)
+            with col4:
+                if st.session_state.current_run_id:
+                    st.metric("Current Run", st.session_state.current_run_id[-8:])  # Show last 8 chars
+                else:
+                    st.metric("Current Run", "None")
+            
+            st.markdown("---")
+            
+            # Runs table with status indicators, built from only the displayed columns
+            # (recent_runs comes from the cache and is left untouched)
+            display_columns = ['run_id', 'run_timestamp', 'excel_file_processed', 'Status',
+                             'reservations_loaded_count', 'emails_found_count', 'audit_pass_count', 'audit_fail_count']
+            display_values = {
+                'Status': recent_runs['status'].map(RUN_STATUS_ICONS).fillna('🟡') + ' ' + recent_runs['status'].astype(str)
+            }
+            available_display_cols = [col for col in display_columns if col in display_values or col in recent_runs.columns]
+            runs_display = pd.DataFrame({col: display_values.get(col, recent_runs.get(col)) for col in available_display_cols})
+            
+            st.dataframe(
+                runs_display,
+                use_container_width=True,
+                height=400
+            )
+            
+            # Run details section
+            st.subheader("🔍 Run Details")
+            
+            # Select a run to view details
+            run_positions = {run_id: pos for pos, run_id in enumerate(recent_runs['run_id'])}
+            run_timestamps = recent_runs['run_timestamp'].tolist()
+            selected_run = st.selectbox(
+                "Select a run to view details:",
+                options=recent_runs['run_id'].tolist(),
+                format_func=lambda x: f"{x[-8:]} - {run_timestamps[run_positions[x]]}"
+            )
+            
+            if selected_run:
+                run_details = recent_runs.iloc[run_positions[selected_run]].to_dict()
+                
+                # Run statistics
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.write("**Run Statistics:**")
+                    st.write(f"• File: {run_details.get('excel_file_processed', 'N/A')}")
+                    st.write(f"• Reservations Loaded: {run_details.get('reservations_loaded_count', 0)}")
+                    st.write(f"• Emails Found: {run_details.get('emails_found_count', 0)}")
+                    st.write(f"• PDF Extractions: {run_details.get('pdf_extractions_count', 0)}")
+                    st.write(f"• Execution Time: {run_details.get('execution_time_seconds', 0):.2f}s")
+                
+                with col2:
+                    st.write("**Audit Results:**")
+                    st.write(f"• Status: {run_details.get('status', 'Unknown')}")
+                    st.write(f"• Passed: {run_details.get('audit_pass_count', 0)}")
+                    st.write(f"• Failed: {run_details.get('audit_fail_count', 0)}")
+                    # success_rate is computed in get_runs_page; NULL when no audits were recorded
+                    if pd.notna(run_details.get('success_rate')):
+                        st.write(f"• Success Rate: {run_details['success_rate']:.1f}%")
+                
+                # Show errors if any
+                if run_details.get('status') in ('COMPLETED', 'FAILED'):
+                    errors = get_cached_run_errors(st.session_state.database, selected_run)
+                else:
+                    errors = st.session_state.database.get_run_errors(selected_run)
+                if errors:
+                    st.subheader("❌ Errors & Issues")
+                    errors_df = pd.DataFrame(errors).reindex(columns=['timestamp', 'context', 'error'])
+                    st.dataframe(errors_df, use_container_width=True, height=300)
+                    
+                    # Full message for one error at a time
+                    error_pos = st.selectbox(
+                        "Show full error message for:", range(len(errors)),
+                        format_func=lambda pos: f"Error {pos + 1} - {errors[pos].get('timestamp', 'Unknown time')}"
+                    )
+                    if error_pos is not None:
+                        error = errors[error_pos]
+                        st.write(f"**Context:** {error.get('context', 'N/A')}")
+                        st.code(error.get('error', 'No error message'), language='text')
+                else:
+                    st.success("✅ No errors recorded for this run")
+                
+                # Export options for this run
+                st.subheader("📥 Export Run Data")
+                export_format = st.radio("Export format", list(EXPORT_FORMATS), horizontal=True, key="run_export_format")
+                extension, mime = EXPORT_FORMATS[export_format]
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    if st.button("Export Raw Data", key=f"export_raw_{selected_run}"):
+                        raw_data = get_run_export(st.session_state.database, run_details)['raw']
+                        if not raw_data.empty:
+                            st.download_button(
+                                label=f"💾 Download Raw Data {export_format}",
+                                data=export_bytes(raw_data, export_format),
+                                file_name=f"raw_data_{selected_run}_{export_timestamp}.{extension}",
+                                mime=mime
+                            )
+                        else:
+                            st.warning("No raw data found for this run")
+                
+                with col2:
+                    if st.button("Export Email Data", key=f"export_email_{selected_run}"):
+                        email_data = get_run_export(st.session_state.database, run_details)['email']
+                        if not email_data.empty:
+                            st.download_button(
+                                label=f"💾 Download Email Data {export_format}",
+                                data=export_bytes(email_data, export_format),
+                                file_name=f"email_data_{selected_run}_{export_timestamp}.{extension}",
+                                mime=mime
+                            )
+                        else:
+                            st.warning("No email data found for this run")
+                
+                with col3:
+                    if st.button("Export Audit Data", key=f"export_audit_{selected_run}"):
+                        audit_data = get_run_export(st.session_state.database, run_details)['audit']
+                        if not audit_data.empty:
+                            st.download_button(
+                                label=f"💾 Download Audit Data {export_format}",
+                                data=export_bytes(audit_data, export_format),
+                                file_name=f"audit_data_{selected_run}_{export_timestamp}.{extension}",
+                                mime=mime
+                            )
+                        else:
+                            st.warning("No audit data found for this run")
+            
+        else:
+            st.info("📭 No runs found in the database yet. Process some data to see runs here.")
+            
+        # Database maintenance section
+        st.subheader("🧹 Database Maintenance")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            cleanup_future = st.session_state.cleanup_future
+            if cleanup_future is None and st.button("🗑️ Clean Old Runs (30+ days)"):
+                # Deleting old runs can take a while; keep the page usable meanwhile
+                cleanup_future = st.session_state.background_executor.submit(
+                    st.session_state.database.cleanup_old_runs, days_to_keep=30
+                )
+                st.session_state.cleanup_future = cleanup_future
+            
+            if cleanup_future is not None:
+                if cleanup_future.done():
+                    st.session_state.cleanup_future = None
+                    try:
+                        deleted_count = cleanup_future.result()
+                        if deleted_count > 0:
+                            st.success(f"✅ Cleaned up {deleted_count} old runs")
+                        else:
+                            st.info("ℹ️ No old runs to clean up")
+                    except Exception as e:
+                        st.error(f"❌ Cleanup failed: {e}")
+                else:
+                    show_job_progress('cleanup_future', "⏳ Cleaning up old runs...", "🔄 Check Cleanup Progress")
+        
+        with col2:
+            # Database summary stats
+            summary_stats = get_cached_db_summary(st.session_state.database, runs_version)
+            st.write("**Database Summary:**")
+            st.write(f"• Total Runs: {summary_stats.get('total_runs', 0)}")
+            st.write(f"• Total Audits: {summary_stats.get('total_audits', 0)}")
+            
+    except Exception as e:
+        st.error(f"❌ Error loading logs: {e}")
+        st.write("This might be due to database initialization issues. Try processing some data first.")
+
 def main():
     st.title("🏨 Entered On Audit System")
     st.markdown("---")
     
+    # One timestamp per render for every download file name
+    export_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
     # Quick info about improvements
     with st.sidebar.expander("🆕 Recent Improvements"):
         st.write("• Complete SQLite integration with persistent storage")
@@ -1745,12 +2640,9 @@ def main():
                     if latest_file:
                         st.session_state.selected_file_path = latest_file
                         try:
-                            result = process_entered_on_report(latest_file)
-                            if len(result) == 3:  # With database (DataFrame, csv_path, run_id)
-                                processed_df, csv_path, run_id = result
-                                st.session_state.current_run_id = run_id
-                            else:  # Without database (DataFrame, csv_path)
-                                processed_df, csv_path = result
+                            # Parse is cached per file version; every load records a new run
+                            processed_df, csv_path, run_id = load_entered_on_report(latest_file, file_version_key(latest_file))
+                            st.session_state.current_run_id = run_id
                             
                             st.session_state.processed_data = processed_df
                             st.session_state.uploaded_file_name = os.path.basename(latest_file)
@@ -1769,12 +2661,9 @@ def main():
                         # Auto-convert the file
                         try:
                             with st.spinner("Auto-processing Excel file..."):
-                                result = process_entered_on_report(latest_file)
-                                if len(result) == 3:  # With database (DataFrame, csv_path, run_id)
-                                    processed_df, csv_path, run_id = result
-                                    st.session_state.current_run_id = run_id
-                                else:  # Without database (DataFrame, csv_path)
-                                    processed_df, csv_path = result
+                                # Parse is cached per file version; every load records a new run
+                                processed_df, csv_path, run_id = load_entered_on_report(latest_file, file_version_key(latest_file))
+                                st.session_state.current_run_id = run_id
                                 
                                 st.session_state.processed_data = processed_df
                                 st.session_state.uploaded_file_name = os.path.basename(latest_file)
@@ -1796,29 +2685,21 @@ def main():
                     if st.session_state.uploaded_file_name != uploaded_file.name:
                         st.session_state.uploaded_file_name = uploaded_file.name
                         
-                        # Save uploaded file temporarily
-                        temp_file_path = f"temp_{uploaded_file.name}"
-                        with open(temp_file_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
+                        # Parse the upload from memory; no temporary copy on disk
+                        upload_bytes = uploaded_file.getvalue()
+                        upload_hash = hashlib.blake2b(upload_bytes, digest_size=16).hexdigest()
                     
                         try:
                             # Process the Excel file
                             with st.spinner("Processing Excel file..."):
-                                result = process_entered_on_report(temp_file_path)
-                                if len(result) == 3:  # With database (DataFrame, csv_path, run_id)
-                                    processed_df, csv_path, run_id = result
-                                    st.session_state.current_run_id = run_id
-                                else:  # Without database (DataFrame, csv_path)
-                                    processed_df, csv_path = result
+                                # Parse is cached per file version; every load records a new run
+                                processed_df, csv_path, run_id = load_entered_on_report(io.BytesIO(upload_bytes), upload_hash, uploaded_file.name)
+                                st.session_state.current_run_id = run_id
                                 
                                 st.session_state.processed_data = processed_df
                             st.success(f"✅ Processed {len(processed_df)} records")
                         except Exception as e:
                             st.error(f"Error processing file: {e}")
-                        finally:
-                            # Clean up temp file
-                            if os.path.exists(temp_file_path):
-                                os.remove(temp_file_path)
             
             # Show current file status
             if st.session_state.processed_data is not None:
@@ -1857,45 +2738,31 @@ def main():
             st.subheader("📄 Email Extraction Results")
             
             # Create simplified table showing only MAIL extraction variables
-            table_data = []
-            
             # Core mail extraction fields to display
             mail_fields = ['FIRST_NAME', 'FULL_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM', 
                           'RATE_CODE', 'C_T_S', 'NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']
             
+            # All extracted email data per guest, merged across that guest's emails
+            merged_email_data = []
             for result in filtered_results:
-                reservation = result['reservation_data']
-                guest_name = reservation.get('FULL_NAME', 'N/A')
-                
-                # Get all extracted email data for this guest
                 email_data = {}
                 for email in result.get('matching_emails', []):
                     if email.get('extracted_data'):
                         email_data.update(email['extracted_data'])
-                
-                # Create row with guest name and mail extraction fields only
-                row_data = {
-                    'Guest_Name': guest_name,
-                    'Email_Status': result['status'],
-                    'Emails_Found': result['email_count']
-                }
-                
-                # Add mail extraction fields with MAIL_ prefix
-                for field in mail_fields:
-                    mail_value = email_data.get(field, 'N/A')
-                    # Format currency fields
-                    if field in ['NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT'] and mail_value != 'N/A':
-                        try:
-                            amount = float(str(mail_value).replace(',', ''))
-                            mail_value = f"AED {amount:,.2f}"
-                        except:
-                            mail_value = 'N/A'
-                    row_data[f'MAIL_{field}'] = mail_value
-                
-                table_data.append(row_data)
+                merged_email_data.append(email_data)
             
-            if table_data:
-                results_df = pd.DataFrame(table_data)
+            if filtered_results:
+                # Build the table column-wise: guest/status columns, then MAIL_ extraction fields
+                results_df = pd.DataFrame({
+                    'Guest_Name': [result['reservation_data'].get('FULL_NAME', 'N/A') for result in filtered_results],
+                    'Email_Status': [result['status'] for result in filtered_results],
+                    'Emails_Found': [result['email_count'] for result in filtered_results],
+                    **{f'MAIL_{field}': [email_data.get(field, 'N/A') for email_data in merged_email_data]
+                       for field in mail_fields}
+                })
+                # Format currency fields column-wise
+                for field in ['NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']:
+                    results_df[f'MAIL_{field}'] = format_aed(results_df[f'MAIL_{field}']).fillna('N/A')
                 st.dataframe(results_df, use_container_width=True, height=500)
                 
                 # Save to database button
@@ -1928,42 +2795,44 @@ def main():
                 if not recent_runs.empty:
                     # Select run to view
                     run_options = recent_runs['run_id'].tolist()
+                    timestamps_by_run = dict(zip(recent_runs['run_id'], recent_runs['run_timestamp']))
                     selected_run = st.selectbox(
                         "Select a run to view email extractions:",
                         options=[''] + run_options,
-                        format_func=lambda x: f"Current Run" if x == st.session_state.current_run_id else (f"{x[-8:]} - {recent_runs[recent_runs['run_id']==x]['run_timestamp'].iloc[0]}" if x else "Select a run...")
+                        format_func=lambda x: f"Current Run" if x == st.session_state.current_run_id else (f"{x[-8:]} - {timestamps_by_run[x]}" if x else "Select a run...")
                     )
                     
                     if selected_run:
                         # Load email extraction data for selected run
-                        email_extraction_df = st.session_state.database.export_data('reservations_email', selected_run)
+                        # Only the displayed columns; run_id filtering uses the idx_email_run_id index
+                        email_extraction_df = st.session_state.database.export_data(
+                            'reservations_email', selected_run,
+                            columns=['guest_name', 'email_subject', 'email_sender', 'folder_name',
+                                     'mail_first_name', 'mail_arrival', 'mail_departure', 'mail_nights',
+                                     'mail_persons', 'mail_room', 'mail_rate_code', 'mail_c_t_s',
+                                     'mail_net_total', 'mail_total', 'mail_tdf', 'mail_adr', 'mail_amount']
+                        )
                         
                         if not email_extraction_df.empty:
-                            # Transform database data to display format
-                            display_data = []
-                            for _, row in email_extraction_df.iterrows():
-                                display_row = {
-                                    'Guest_Name': row['guest_name'],
-                                    'Email_Subject': row['email_subject'][:50] + '...' if len(row['email_subject']) > 50 else row['email_subject'],
-                                    'Email_Sender': row['email_sender'],
-                                    'Folder': row['folder_name'],
-                                    'MAIL_FIRST_NAME': row['mail_first_name'],
-                                    'MAIL_ARRIVAL': row['mail_arrival'],
-                                    'MAIL_DEPARTURE': row['mail_departure'],
-                                    'MAIL_NIGHTS': row['mail_nights'],
-                                    'MAIL_PERSONS': row['mail_persons'],
-                                    'MAIL_ROOM': row['mail_room'],
-                                    'MAIL_RATE_CODE': row['mail_rate_code'],
-                                    'MAIL_C_T_S': row['mail_c_t_s'],
-                                    'MAIL_NET_TOTAL': f"AED {row['mail_net_total']:,.2f}" if row['mail_net_total'] > 0 else 'N/A',
-                                    'MAIL_TOTAL': f"AED {row['mail_total']:,.2f}" if row['mail_total'] > 0 else 'N/A',
-                                    'MAIL_TDF': f"AED {row['mail_tdf']:,.2f}" if row['mail_tdf'] > 0 else 'N/A',
-                                    'MAIL_ADR': f"AED {row['mail_adr']:,.2f}" if row['mail_adr'] > 0 else 'N/A',
-                                    'MAIL_AMOUNT': f"AED {row['mail_amount']:,.2f}" if row['mail_amount'] > 0 else 'N/A'
-                                }
-                                display_data.append(display_row)
-                            
-                            previous_df = pd.DataFrame(display_data)
+                            # Transform database data to display format, column by column
+                            subjects = email_extraction_df['email_subject'].fillna('')
+                            previous_df = pd.DataFrame({
+                                'Guest_Name': email_extraction_df['guest_name'],
+                                'Email_Subject': subjects.str.slice(0, 50).where(subjects.str.len() <= 50, subjects.str.slice(0, 50) + '...'),
+                                'Email_Sender': email_extraction_df['email_sender'],
+                                'Folder': email_extraction_df['folder_name'],
+                                'MAIL_FIRST_NAME': email_extraction_df['mail_first_name'],
+                                'MAIL_ARRIVAL': email_extraction_df['mail_arrival'],
+                                'MAIL_DEPARTURE': email_extraction_df['mail_departure'],
+                                'MAIL_NIGHTS': email_extraction_df['mail_nights'],
+                                'MAIL_PERSONS': email_extraction_df['mail_persons'],
+                                'MAIL_ROOM': email_extraction_df['mail_room'],
+                                'MAIL_RATE_CODE': email_extraction_df['mail_rate_code'],
+                                'MAIL_C_T_S': email_extraction_df['mail_c_t_s'],
+                            })
+                            for field in ['NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']:
+                                amounts = email_extraction_df[f'mail_{field.lower()}']
+                                previous_df[f'MAIL_{field}'] = format_aed(amounts).where(amounts > 0, 'N/A')
                             
                             # Show summary
                             col1, col2, col3 = st.columns(3)
@@ -1973,18 +2842,19 @@ def main():
                                 unique_guests = previous_df['Guest_Name'].nunique()
                                 st.metric("Unique Guests", unique_guests)
                             with col3:
-                                with_data = len([row for row in display_data if any(v != 'N/A' for k, v in row.items() if k.startswith('MAIL_'))])
+                                mail_columns = [col for col in previous_df.columns if col.startswith('MAIL_')]
+                                with_data = int((previous_df[mail_columns] != 'N/A').any(axis=1).sum())
                                 st.metric("With Extraction Data", with_data)
                             
                             # Display the data
                             st.dataframe(previous_df, use_container_width=True, height=400)
                             
                             # Export option
-                            csv_data = previous_df.to_csv(index=False)
+                            csv_data = csv_bytes(previous_df)
                             st.download_button(
                                 label="📥 Download Previous Email Extractions CSV",
                                 data=csv_data,
-                                file_name=f"previous_email_extractions_{selected_run}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                                file_name=f"previous_email_extractions_{selected_run}_{export_timestamp}.csv",
                                 mime="text/csv"
                             )
                         else:
@@ -1998,35 +2868,12 @@ def main():
             # Export results
             st.markdown("---")
             if st.button("📥 Export Email Results"):
-                # Create export DataFrame
-                export_data = []
-                for result in email_results:
-                    reservation = result['reservation_data']
-                    base_row = {
-                        'Guest_Name': reservation.get('FULL_NAME', ''),
-                        'Arrival': reservation.get('ARRIVAL', ''),
-                        'Departure': reservation.get('DEPARTURE', ''),
-                        'Nights': reservation.get('NIGHTS', ''),
-                        'Room': reservation.get('ROOM', ''),
-                        'Amount_AED': reservation.get('AMOUNT', ''),
-                        'Email_Status': result['status'],
-                        'Emails_Found': result['email_count'],
-                        'PDF_Data_Found': result['has_pdf_data']
-                    }
-                    
-                    # Add email extracted fields
-                    for field, value in reservation.items():
-                        if field.startswith('EMAIL_'):
-                            base_row[field] = value
-                    
-                    export_data.append(base_row)
-                
-                export_df = pd.DataFrame(export_data)
-                csv = export_df.to_csv(index=False)
+                export_df = get_email_export(email_results)
+                csv = csv_bytes(export_df)
                 st.download_button(
                     label="💾 Download Email Results CSV",
                     data=csv,
-                    file_name=f"email_extraction_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    file_name=f"email_extraction_results_{export_timestamp}.csv",
                     mime="text/csv"
                 )
         else:
@@ -2040,41 +2887,41 @@ def main():
             df = st.session_state.processed_data
             
             # Summary metrics
+            summary = get_data_summary(df)
             with st.expander("📊 Summary Statistics", expanded=True):
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    st.metric("Total Records", len(df))
+                    st.metric("Total Records", summary['total_records'])
                 with col2:
-                    total_amount = df['AMOUNT'].sum() if 'AMOUNT' in df.columns else 0
-                    st.metric("Total Amount (AED)", f"AED {total_amount:,.2f}")
+                    st.metric("Total Amount (AED)", f"AED {summary['total_amount']:,.2f}")
                 with col3:
-                    total_nights = df['NIGHTS'].sum() if 'NIGHTS' in df.columns else 0
-                    st.metric("Total Nights", f"{total_nights:,}")
+                    st.metric("Total Nights", f"{summary['total_nights']:,}")
                 with col4:
-                    avg_adr = df['ADR'].mean() if 'ADR' in df.columns else 0
-                    st.metric("Average ADR (AED)", f"AED {avg_adr:.2f}")
+                    st.metric("Average ADR (AED)", f"AED {summary['avg_adr']:.2f}")
             
             # Filters
+            loaded_df = df
+            selected_season = selected_company = 'All'
             with st.expander("🔍 Data Filters", expanded=False):
                 col1, col2, col3 = st.columns(3)
                 
                 with col1:
                     if 'SEASON' in df.columns:
-                        seasons = ['All'] + list(df['SEASON'].unique())
+                        seasons = get_filter_options(loaded_df, 'SEASON')
                         selected_season = st.selectbox("Season", seasons)
                         if selected_season != 'All':
                             df = df[df['SEASON'] == selected_season]
                 
                 with col2:
                     if 'COMPANY_CLEAN' in df.columns:
-                        companies = ['All'] + list(df['COMPANY_CLEAN'].unique())
+                        companies = get_filter_options(loaded_df, 'COMPANY_CLEAN', df, (selected_season,))
                         selected_company = st.selectbox("Company", companies)
                         if selected_company != 'All':
                             df = df[df['COMPANY_CLEAN'] == selected_company]
                 
                 with col3:
                     if 'ROOM' in df.columns:
-                        rooms = ['All'] + list(df['ROOM'].unique())
+                        rooms = get_filter_options(loaded_df, 'ROOM', df, (selected_season, selected_company))
                         selected_room = st.selectbox("Room Type", rooms)
                         if selected_room != 'All':
                             df = df[df['ROOM'] == selected_room]
@@ -2088,11 +2935,11 @@ def main():
             )
             
             # Download button
-            csv = df.to_csv(index=False)
+            csv = csv_bytes(df)
             st.download_button(
                 label="💾 Download as CSV",
                 data=csv,
-                file_name=f"entered_on_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                file_name=f"entered_on_data_{export_timestamp}.csv",
                 mime="text/csv"
             )
             
@@ -2105,13 +2952,26 @@ def main():
         
         if st.session_state.processed_data is not None:
             # Run audit button
-            if st.button("🔄 Run Audit Checks"):
-                with st.spinner("Performing audit checks including email extraction comparison..."):
-                    audit_df = perform_audit_checks(
-                        st.session_state.processed_data, st.session_state.email_data,
-                        run_id=st.session_state.current_run_id, db=st.session_state.database
-                    )
-                    st.session_state.audit_results = audit_df
+            audit_future = st.session_state.audit_future
+            if audit_future is None and st.button("🔄 Run Audit Checks"):
+                # Run in the background so the rest of the page stays usable
+                audit_future = st.session_state.background_executor.submit(
+                    perform_audit_checks,
+                    st.session_state.processed_data, st.session_state.email_data,
+                    run_id=st.session_state.current_run_id, db=st.session_state.database
+                )
+                st.session_state.audit_future = audit_future
+            
+            if audit_future is not None:
+                if audit_future.done():
+                    st.session_state.audit_future = None
+                    try:
+                        st.session_state.audit_results = audit_future.result()
+                    except Exception as e:
+                        st.error(f"❌ Audit checks failed: {e}")
+                else:
+                    show_job_progress('audit_future', "⏳ Performing audit checks including email extraction comparison...",
+                                      "🔄 Check Audit Progress")
             
             if st.session_state.audit_results is not None:
                 audit_df = st.session_state.audit_results
@@ -2176,69 +3036,58 @@ def main():
                 available_columns = [col for col in display_columns if col in display_df.columns]
                 
                 # Apply conditional formatting to highlight mismatched Mail_ columns
-                def highlight_mismatched_data(row):
-                    styles = [''] * len(row)
+                def highlight_mismatched_data(data):
+                    """Style every Mail_ column at once (Styler.apply with axis=None)"""
+                    styles = pd.DataFrame('', index=data.index, columns=data.columns)
+                    green, red = 'color: green; font-weight: bold', 'color: red; font-weight: bold'
                     
-                    # Define comparison fields locally
-                    comparison_fields_local = ['FIRST_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM', 
-                                             'RATE_CODE', 'C_T_S', 'NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']
+                    def as_text(values):
+                        return values.astype(object).where(values.notna(), 'N/A').map(str).str.strip()
+                    
+                    def as_amount(text):
+                        return parse_amounts(text).round(2)
                     
                     # Compare each field with its Mail_ counterpart
+                    comparison_fields_local = ['FIRST_NAME', 'ARRIVAL', 'DEPARTURE', 'NIGHTS', 'PERSONS', 'ROOM', 
+                                             'RATE_CODE', 'C_T_S', 'NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']
                     for field in comparison_fields_local:
-                        original_col = field
                         mail_col = f'Mail_{field}'
+                        if field not in data.columns or mail_col not in data.columns:
+                            continue
                         
-                        if original_col in row.index and mail_col in row.index:
-                            original_val = str(row[original_col]).strip() if pd.notna(row[original_col]) else 'N/A'
-                            mail_val = str(row[mail_col]).strip() if pd.notna(row[mail_col]) else 'N/A'
-                            
-                            # Skip comparison if either is N/A
-                            if original_val != 'N/A' and mail_val != 'N/A':
-                                try:
-                                    mail_col_idx = row.index.get_loc(mail_col)
-                                    
-                                    # For numeric fields (amounts), apply rounding to 2 decimal places and tolerance logic
-                                    if field in ['NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']:
-                                        try:
-                                            # Clean and convert to float, removing AED prefix and commas
-                                            original_clean = original_val.replace('AED', '').replace(',', '').strip()
-                                            mail_clean = mail_val.replace('AED', '').replace(',', '').strip()
-                                            
-                                            original_num = round(float(original_clean), 2)
-                                            mail_num = round(float(mail_clean), 2)
-                                            
-                                            # Calculate difference
-                                            difference = abs(original_num - mail_num)
-                                            
-                                            if difference == 0:
-                                                # Perfect match - mark green
-                                                styles[mail_col_idx] = 'color: green; font-weight: bold'
-                                            elif difference <= 1:
-                                                # Within ±1 tolerance - don't mark red (no special color)
-                                                pass
-                                            else:
-                                                # Outside tolerance - mark red
-                                                styles[mail_col_idx] = 'color: red; font-weight: bold'
-                                        except (ValueError, TypeError):
-                                            # Non-numeric comparison fallback
-                                            if original_val == mail_val:
-                                                styles[mail_col_idx] = 'color: green; font-weight: bold'
-                                            else:
-                                                styles[mail_col_idx] = 'color: red; font-weight: bold'
-                                    else:
-                                        # Non-numeric fields - exact match comparison
-                                        if original_val == mail_val:
-                                            styles[mail_col_idx] = 'color: green; font-weight: bold'
-                                        else:
-                                            styles[mail_col_idx] = 'color: red; font-weight: bold'
-                                except KeyError:
-                                    continue
+                        original_val = as_text(data[field])
+                        mail_val = as_text(data[mail_col])
+                        # Skip comparison if either is N/A
+                        compared = (original_val != 'N/A') & (mail_val != 'N/A')
+                        same_text = original_val == mail_val
+                        
+                        if field in ['NET_TOTAL', 'TOTAL', 'TDF', 'ADR', 'AMOUNT']:
+                            # Amounts rounded to 2 decimals: exact match green, within ±1 unmarked, else red;
+                            # values that are not numeric fall back to exact text comparison
+                            difference = (as_amount(original_val) - as_amount(mail_val)).abs()
+                            numeric = difference.notna()
+                            is_green = compared & ((numeric & (difference == 0)) | (~numeric & same_text))
+                            is_red = compared & ((numeric & (difference > 1)) | (~numeric & ~same_text))
+                        else:
+                            # Non-numeric fields - exact match comparison
+                            is_green = compared & same_text
+                            is_red = compared & ~same_text
+                        
+                        styles[mail_col] = np.select([is_green, is_red], [green, red], default='')
                     
                     return styles
                 
+                # Style one page of rows at a time; Styler output grows with every styled cell
+                page_size = 500
+                page_df = display_df[available_columns]
+                if len(page_df) > page_size:
+                    page = st.number_input("Audit results page", min_value=1,
+                                           max_value=(len(page_df) - 1) // page_size + 1, value=1) - 1
+                    page_df = page_df.iloc[page * page_size:(page + 1) * page_size]
+                
                 # Create styled dataframe with conditional formatting
                 try:
-                    styled_df = display_df[available_columns].style.apply(highlight_mismatched_data, axis=1)
+                    styled_df = page_df.style.apply(highlight_mismatched_data, axis=None)
                     st.dataframe(
                         styled_df,
                         use_container_width=True,
@@ -2248,7 +3097,7 @@ def main():
                     # Fallback to regular dataframe if styling fails
                     st.warning(f"Conditional formatting failed: {e}")
                     st.dataframe(
-                        display_df[available_columns],
+                        page_df,
                         use_container_width=True,
                         height=600
                     )
@@ -2258,40 +3107,57 @@ def main():
                     st.subheader("❌ Failed Records Details")
                     failed_df = audit_df[audit_df['audit_status'] == 'FAIL']
                     
-                    for idx, row in failed_df.iterrows():
-                        with st.expander(f"❌ {row.get('FULL_NAME', 'Unknown Guest')} - {row.get('audit_issues', 'No issues listed')}"):
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                st.write("**Guest Information:**")
-                                st.write(f"Name: {row.get('FULL_NAME', 'N/A')}")
-                                st.write(f"Arrival: {row.get('ARRIVAL', 'N/A')}")
-                                st.write(f"Departure: {row.get('DEPARTURE', 'N/A')}")
-                                st.write(f"Nights: {row.get('NIGHTS', 'N/A')}")
-                                st.write(f"Persons: {row.get('PERSONS', 'N/A')}")
-                                st.write(f"Room: {row.get('ROOM', 'N/A')}")
-                                # Show rate information
-                                if pd.notna(row.get('TDF')):
-                                    st.write(f"TDF: AED {row.get('TDF', 0):,.2f}")
-                                if pd.notna(row.get('NET_TOTAL')):
-                                    st.write(f"Net Total: AED {row.get('NET_TOTAL', 0):,.2f}")
-                                if pd.notna(row.get('MAIL_TDF_AED')):
-                                    st.write(f"Email TDF: {row.get('MAIL_TDF_AED', 'N/A')}")
-                                if pd.notna(row.get('MAIL_NET_TOTAL_AED')):
-                                    st.write(f"Email Net Total: {row.get('MAIL_NET_TOTAL_AED', 'N/A')}")
-                            with col2:
-                                st.write("**Issues Found:**")
-                                issues = row.get('audit_issues', '').split(';')
-                                for issue in issues:
-                                    if issue.strip():
-                                        st.write(f"• {issue.strip()}")
-                
+                    # One table for all failures; full details for a single selected record at a time
+                    summary_columns = [col for col in ['FULL_NAME', 'ARRIVAL', 'DEPARTURE', 'audit_issues'] if col in failed_df.columns]
+                    st.dataframe(failed_df[summary_columns], use_container_width=True, height=300)
+                    
+                    page_size = 500
+                    page = 0
+                    if len(failed_df) > page_size:
+                        page = st.number_input("Failed records page", min_value=1,
+                                               max_value=(len(failed_df) - 1) // page_size + 1, value=1) - 1
+                    page_df = failed_df.iloc[page * page_size:(page + 1) * page_size]
+                    guest_names = page_df['FULL_NAME'].tolist() if 'FULL_NAME' in page_df.columns else ['Unknown Guest'] * len(page_df)
+                    selected_pos = st.selectbox(
+                        "Show details for", range(len(page_df)),
+                        format_func=lambda pos: f"❌ {guest_names[pos]}"
+                    )
+                    
+                    if selected_pos is not None:
+                        row = page_df.iloc[selected_pos]
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.write("**Guest Information:**")
+                            st.write(f"Name: {row.get('FULL_NAME', 'N/A')}")
+                            st.write(f"Arrival: {row.get('ARRIVAL', 'N/A')}")
+                            st.write(f"Departure: {row.get('DEPARTURE', 'N/A')}")
+                            st.write(f"Nights: {row.get('NIGHTS', 'N/A')}")
+                            st.write(f"Persons: {row.get('PERSONS', 'N/A')}")
+                            st.write(f"Room: {row.get('ROOM', 'N/A')}")
+                            # Show rate information
+                            if pd.notna(row.get('TDF')):
+                                st.write(f"TDF: AED {row.get('TDF', 0):,.2f}")
+                            if pd.notna(row.get('NET_TOTAL')):
+                                st.write(f"Net Total: AED {row.get('NET_TOTAL', 0):,.2f}")
+                            if pd.notna(row.get('MAIL_TDF_AED')):
+                                st.write(f"Email TDF: {row.get('MAIL_TDF_AED', 'N/A')}")
+                            if pd.notna(row.get('MAIL_NET_TOTAL_AED')):
+                                st.write(f"Email Net Total: {row.get('MAIL_NET_TOTAL_AED', 'N/A')}")
+                        with col2:
+                            st.write("**Issues Found:**")
+                            issues = row.get('audit_issues', '').split(';')
+                            for issue in issues:
+                                if issue.strip():
+                                    st.write(f"• {issue.strip()}")
+            
                 # Download audit results
-                audit_csv = audit_df.to_csv(index=False)
+                audit_format = st.radio("Audit download format", list(EXPORT_FORMATS), horizontal=True, key="audit_export_format")
+                extension, mime = EXPORT_FORMATS[audit_format]
                 st.download_button(
                     label="💾 Download Audit Results",
-                    data=audit_csv,
-                    file_name=f"audit_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv"
+                    data=export_bytes(audit_df, audit_format),
+                    file_name=f"audit_results_{export_timestamp}.{extension}",
+                    mime=mime
                 )
             
             else:
@@ -2302,169 +3168,7 @@ def main():
     
     # Tab 4: Logs & History
     with tab4:
-        st.header("📝 Logs & History")
-        
-        # Recent runs section
-        st.subheader("🔄 Recent Runs")
-        
-        try:
-            recent_runs = st.session_state.database.get_recent_runs(limit=20)
-            
-            if not recent_runs.empty:
-                # Summary metrics for recent runs
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric("Total Runs", len(recent_runs))
-                with col2:
-                    completed_runs = len(recent_runs[recent_runs['status'] == 'COMPLETED'])
-                    st.metric("Completed", completed_runs)
-                with col3:
-                    failed_runs = len(recent_runs[recent_runs['status'] == 'FAILED'])
-                    st.metric("Failed", failed_runs, delta=f"{failed_runs}" if failed_runs > 0 else None)
-                with col4:
-                    if st.session_state.current_run_id:
-                        st.metric("Current Run", st.session_state.current_run_id[-8:])  # Show last 8 chars
-                    else:
-                        st.metric("Current Run", "None")
-                
-                st.markdown("---")
-                
-                # Runs table with status indicators
-                runs_display = recent_runs.copy()
-                runs_display['run_timestamp'] = pd.to_datetime(runs_display['run_timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
-                runs_display['Status'] = runs_display['status'].apply(
-                    lambda x: f"🟢 {x}" if x == 'COMPLETED' else f"🔴 {x}" if x == 'FAILED' else f"🟡 {x}"
-                )
-                
-                # Display runs table
-                display_columns = ['run_id', 'run_timestamp', 'excel_file_processed', 'Status',
-                                 'reservations_loaded_count', 'emails_found_count', 'audit_pass_count', 'audit_fail_count']
-                available_display_cols = [col for col in display_columns if col in runs_display.columns]
-                
-                st.dataframe(
-                    runs_display[available_display_cols],
-                    use_container_width=True,
-                    height=400
-                )
-                
-                # Run details section
-                st.subheader("🔍 Run Details")
-                
-                # Select a run to view details
-                selected_run = st.selectbox(
-                    "Select a run to view details:",
-                    options=recent_runs['run_id'].tolist(),
-                    format_func=lambda x: f"{x[-8:]} - {recent_runs[recent_runs['run_id']==x]['run_timestamp'].iloc[0]}"
-                )
-                
-                if selected_run:
-                    run_details = recent_runs[recent_runs['run_id'] == selected_run].iloc[0]
-                    
-                    # Run statistics
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write("**Run Statistics:**")
-                        st.write(f"• File: {run_details.get('excel_file_processed', 'N/A')}")
-                        st.write(f"• Reservations Loaded: {run_details.get('reservations_loaded_count', 0)}")
-                        st.write(f"• Emails Found: {run_details.get('emails_found_count', 0)}")
-                        st.write(f"• PDF Extractions: {run_details.get('pdf_extractions_count', 0)}")
-                        st.write(f"• Execution Time: {run_details.get('execution_time_seconds', 0):.2f}s")
-                    
-                    with col2:
-                        st.write("**Audit Results:**")
-                        st.write(f"• Status: {run_details.get('status', 'Unknown')}")
-                        st.write(f"• Passed: {run_details.get('audit_pass_count', 0)}")
-                        st.write(f"• Failed: {run_details.get('audit_fail_count', 0)}")
-                        if run_details.get('audit_pass_count', 0) + run_details.get('audit_fail_count', 0) > 0:
-                            success_rate = (run_details.get('audit_pass_count', 0) / 
-                                          (run_details.get('audit_pass_count', 0) + run_details.get('audit_fail_count', 0))) * 100
-                            st.write(f"• Success Rate: {success_rate:.1f}%")
-                    
-                    # Show errors if any
-                    errors = st.session_state.database.get_run_errors(selected_run)
-                    if errors:
-                        st.subheader("❌ Errors & Issues")
-                        for idx, error in enumerate(errors, 1):
-                            with st.expander(f"Error {idx} - {error.get('timestamp', 'Unknown time')}", expanded=False):
-                                st.write(f"**Context:** {error.get('context', 'N/A')}")
-                                st.code(error.get('error', 'No error message'), language='text')
-                    else:
-                        st.success("✅ No errors recorded for this run")
-                    
-                    # Export options for this run
-                    st.subheader("📥 Export Run Data")
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        if st.button("Export Raw Data", key=f"export_raw_{selected_run}"):
-                            raw_data = st.session_state.database.export_data('reservations_raw', selected_run)
-                            if not raw_data.empty:
-                                csv = raw_data.to_csv(index=False)
-                                st.download_button(
-                                    label="💾 Download Raw Data CSV",
-                                    data=csv,
-                                    file_name=f"raw_data_{selected_run}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                    mime="text/csv"
-                                )
-                            else:
-                                st.warning("No raw data found for this run")
-                    
-                    with col2:
-                        if st.button("Export Email Data", key=f"export_email_{selected_run}"):
-                            email_data = st.session_state.database.export_data('reservations_email', selected_run)
-                            if not email_data.empty:
-                                csv = email_data.to_csv(index=False)
-                                st.download_button(
-                                    label="💾 Download Email Data CSV",
-                                    data=csv,
-                                    file_name=f"email_data_{selected_run}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                    mime="text/csv"
-                                )
-                            else:
-                                st.warning("No email data found for this run")
-                    
-                    with col3:
-                        if st.button("Export Audit Data", key=f"export_audit_{selected_run}"):
-                            audit_data = st.session_state.database.export_data('reservations_audit', selected_run)
-                            if not audit_data.empty:
-                                csv = audit_data.to_csv(index=False)
-                                st.download_button(
-                                    label="💾 Download Audit Data CSV",
-                                    data=csv,
-                                    file_name=f"audit_data_{selected_run}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                    mime="text/csv"
-                                )
-                            else:
-                                st.warning("No audit data found for this run")
-                
-            else:
-                st.info("📭 No runs found in the database yet. Process some data to see runs here.")
-                
-            # Database maintenance section
-            st.subheader("🧹 Database Maintenance")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("🗑️ Clean Old Runs (30+ days)"):
-                    try:
-                        deleted_count = st.session_state.database.cleanup_old_runs(days_to_keep=30)
-                        if deleted_count > 0:
-                            st.success(f"✅ Cleaned up {deleted_count} old runs")
-                        else:
-                            st.info("ℹ️ No old runs to clean up")
-                    except Exception as e:
-                        st.error(f"❌ Cleanup failed: {e}")
-            
-            with col2:
-                # Database summary stats
-                summary_stats = st.session_state.database.get_summary_stats()
-                st.write("**Database Summary:**")
-                st.write(f"• Total Runs: {summary_stats.get('total_runs', 0)}")
-                st.write(f"• Total Audits: {summary_stats.get('total_audits', 0)}")
-                
-        except Exception as e:
-            st.error(f"❌ Error loading logs: {e}")
-            st.write("This might be due to database initialization issues. Try processing some data first.")
+        render_logs_tab()
 
     # Tab 5: NER Training
     with tab5: